@@ -0,0 +1 @@
+'''Modules shared by the tsp and knapsack solvers; each CLI puts the repository root on sys.path to import them'''
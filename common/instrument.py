@@ -0,0 +1,85 @@
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+PHASES = ('init', 'neighbours', 'scoring', 'selection')
+
+class Instrument:
+    '''
+        Counters, phase timers and a convergence trace for one solver run.
+        Solvers take instrument=None and only touch it when one is given, so an uninstrumented run pays a None check and nothing else.
+        Phase times are exclusive: entering a phase inside another one pauses the outer phase until it is left.
+        Every callback is called with each iteration record as it is added to the trace.
+    '''
+    def __init__(self, callbacks=(), keep_trace=True):
+        self.callbacks = list(callbacks)
+        self.keep_trace = keep_trace
+        self.trace = []
+        self.evaluations = 0
+        self.proposed = 0
+        self.accepted = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.phases = []
+        self.started = self.mark = time.perf_counter()
+
+    def __charge(self):
+        '''Adds the time since the last mark to the innermost open phase'''
+        now = time.perf_counter()
+        if self.phases:
+            self.seconds[self.phases[-1]] += now - self.mark
+        self.mark = now
+
+    def enter(self, phase):
+        self.__charge()
+        self.phases.append(phase)
+
+    def leave(self):
+        self.__charge()
+        self.phases.pop()
+
+    def switch(self, phase):
+        '''Leaves the innermost phase and enters another in its place'''
+        self.__charge()
+        self.phases[-1] = phase
+
+    @contextmanager
+    def phase(self, name):
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def iteration(self, iteration, current, best, **extra):
+        '''Records the state after one iteration (an epoch, temperature step or generation) and hands it to the callbacks'''
+        record = {'iteration': iteration, 'seconds': time.perf_counter() - self.started, 'current': current, 'best': best,
+                  'evaluations': self.evaluations, 'proposed': self.proposed, 'accepted': self.accepted}
+        record.update(extra)
+        if self.keep_trace:
+            self.trace.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def summary(self):
+        return {'seconds': time.perf_counter() - self.started, 'iterations': len(self.trace), 'evaluations': self.evaluations,
+                'proposed': self.proposed, 'accepted': self.accepted, 'phases': dict(self.seconds)}
+
+    def to_csv(self, filename):
+        '''Writes the trace with one row per iteration; columns from extra fields are appended after the standard ones'''
+        fields = list(dict.fromkeys(key for record in self.trace for key in record))
+        with open(filename, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.trace)
+
+    def to_json(self, filename):
+        with open(filename, 'w') as file:
+            json.dump({'summary': self.summary(), 'trace': self.trace}, file, indent=2)
+
+    def save(self, filename):
+        '''to_json for a .json filename, to_csv otherwise'''
+        if filename.lower().endswith('.json'):
+            self.to_json(filename)
+        else:
+            self.to_csv(filename)
@@ -0,0 +1,64 @@
+import time
+
+class StoppingCriteria:
+    '''
+        When a solver should end before its own iteration count runs out: after deadline seconds of wall-clock time,
+        after max_evaluations scored solutions, after patience iterations without improving the best value,
+        or once the best value reaches target. Values are minimised unless maximise is set.
+        The clock starts when the criteria are made (call start() to reuse them for another run), so loading and setup count.
+        Solvers call check() once per iteration and finish() with their own reason when they end by themselves;
+        reason then says why the run ended.
+    '''
+    def __init__(self, deadline=None, max_evaluations=None, patience=None, target=None, maximise=False, tolerance=1e-9):
+        self.deadline = deadline
+        self.max_evaluations = max_evaluations
+        self.patience = patience
+        self.target = target
+        self.maximise = maximise
+        self.tolerance = tolerance
+        self.start()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.best = None
+        self.stalled = 0
+        self.iterations = 0
+        self.reason = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def improves(self, value):
+        if self.best is None:
+            return True
+        if self.maximise:
+            return value > self.best + self.tolerance
+        return value < self.best - self.tolerance
+
+    def reached(self, value):
+        if self.target is None:
+            return False
+        return value >= self.target if self.maximise else value <= self.target
+
+    def check(self, best, evaluations=0):
+        '''Records the best value after one more iteration and the evaluations so far, and returns True once the run should stop'''
+        self.iterations += 1
+        if self.improves(best):
+            self.best, self.stalled = best, 0
+        else:
+            self.stalled += 1
+        if self.reached(best):
+            self.reason = 'target'
+        elif self.max_evaluations is not None and evaluations >= self.max_evaluations:
+            self.reason = 'evaluations'
+        elif self.patience is not None and self.stalled >= self.patience:
+            self.reason = 'stagnation'
+        elif self.deadline is not None and self.elapsed() >= self.deadline:
+            self.reason = 'deadline'
+        return self.reason is not None
+
+    def finish(self, reason):
+        '''Records why the solver ended by itself, unless one of the criteria stopped it first, and returns the reason'''
+        if self.reason is None:
+            self.reason = reason
+        return self.reason
@@ -0,0 +1,197 @@
+import math
+import numpy as np
+from localsearch import ItemArrays
+from common.stopping import StoppingCriteria
+
+#the take bitsets hold one bit per item piece and capacity
+MAX_TABLE_BYTES = 2 ** 30
+
+def weightScale(weights , maxDecimals : int = 6):
+    '''Smallest power of ten that turns every weight into a whole number'''
+    weights = np.asarray(weights , dtype=np.float64)
+    for decimals in range(maxDecimals + 1):
+        scaled = weights * 10 ** decimals
+        if np.all(np.abs(scaled - np.round(scaled)) < 1e-6):
+            return 10 ** decimals
+    raise ValueError(f"Weights need more than {maxDecimals} decimals to become integers, the dynamic programme can't scale them")
+
+def splitAmounts(amounts):
+    '''
+        Binary splitting of the multiplicities: an item with amount a becomes pieces of 1, 2, 4, ... copies and a remainder,
+        whose subsets add up to every count from 0 to a. Returns the item and the copy count of every piece.
+    '''
+    pieceItems , pieceCounts = [] , []
+    for item , amount in enumerate(amounts):
+        count = 1
+        while amount > 0:
+            taken = min(count , amount)
+            pieceItems.append(item)
+            pieceCounts.append(taken)
+            amount -= taken
+            count *= 2
+    return np.array(pieceItems , dtype=np.intp) , np.array(pieceCounts , dtype=np.int64)
+
+def boundedKnapsack(values , weights , amounts , capacity : int):
+    '''
+        Exact bounded knapsack over integer weights: the most valuable quantities, at most amounts of each item,
+        of total weight at most capacity. Items are split into binary pieces and solved as a 0/1 knapsack with a
+        one-dimensional DP over the capacities, each piece a single vectorised shift-and-maximum over the whole array.
+        Whether a piece improved each capacity is kept as a packed bitset, one bit per capacity, for the reconstruction.
+        Returns the quantities and their value.
+    '''
+    values , weights = np.asarray(values) , np.asarray(weights , dtype=np.int64)
+    amounts = np.asarray(amounts , dtype=np.int64)
+    quantities = np.zeros(len(values) , dtype=np.int64)
+    #weightless items never compete for capacity, all of each valuable one goes in
+    free = (weights == 0) & (values > 0)
+    quantities[free] = amounts[free]
+    #no more copies than fit on their own, and no pieces that never fit
+    usable = (weights > 0) & (weights <= capacity) & (values > 0)
+    limits = np.where(usable , np.minimum(amounts , capacity // np.maximum(weights , 1)) , 0)
+    pieceItems , pieceCounts = splitAmounts(limits.tolist())
+    tableBytes = len(pieceItems) * (capacity // 8 + 1)
+    if tableBytes > MAX_TABLE_BYTES:
+        raise ValueError(f"The dynamic programme would keep {tableBytes} bytes of bitsets for {len(pieceItems)} item pieces and capacity {capacity} (at most {MAX_TABLE_BYTES})")
+    best = np.zeros(capacity + 1 , dtype=values.dtype)
+    taken = []
+    for item , count in zip(pieceItems.tolist() , pieceCounts.tolist()):
+        weight , value = int(weights[item]) * count , values[item] * count
+        #best[c - weight] still holds the value before this piece, so every piece is used at most once
+        shifted = best[:capacity + 1 - weight] + value
+        better = shifted > best[weight:]
+        np.maximum(best[weight:] , shifted , out=best[weight:])
+        taken.append(np.packbits(better))
+    #best never decreases with the capacity, so the optimum sits at the full capacity
+    remaining = capacity
+    for piece in range(len(taken) - 1 , -1 , -1):
+        item , count = int(pieceItems[piece]) , int(pieceCounts[piece])
+        weight = int(weights[item]) * count
+        if remaining >= weight:
+            k = remaining - weight
+            if taken[piece][k >> 3] >> (7 - (k & 7)) & 1:
+                quantities[item] += count
+                remaining -= weight
+    return quantities , (quantities @ values).item()
+
+class DynamicProgramming:
+    '''Exact solver for the bounded knapsack knapsack.py reads, with weights scaled to integers by a power of ten'''
+    def __init__(self , items : dict , maxWeight : float , scale : int = None):
+        self.items = items
+        self.maxWeight = maxWeight
+        self.arrays = ItemArrays(items , maxWeight)
+        self.scale = scale if scale is not None else weightScale(self.arrays.weights)
+
+    def search(self):
+        weights = np.round(self.arrays.weights * self.scale).astype(np.int64)
+        capacity = int(np.floor(self.maxWeight * self.scale + 1e-6))
+        quantities , value = boundedKnapsack(self.arrays.values , weights , self.arrays.amounts , capacity)
+        return {"solution" : self.arrays.toSolution(quantities) , "value" : value , "stopped" : "optimal"}
+
+class BranchAndBound:
+    '''
+        Exact, anytime branch and bound for the bounded knapsack, for weights too finely grained for the dynamic programme.
+        Items are taken by falling value per unit of weight and every node branches on how many copies of the next item
+        go in, the most first, so the first leaf reached is the greedy solution. A node is cut when its value plus the
+        fractional relaxation of the remaining items (ItemArrays.upperBound from that node) can't beat the best solution so far.
+        The relaxation comes from prefix sums of the sorted items and a pointer to the break item that each node moves
+        from where the previous one left it, so a branching step only pays for how far the break item actually moves.
+        incumbent, the result of HillClimbing or GeneticAlgorithm or a quantity vector, seeds the best solution so far.
+        maxNodes (checked at every node) or stopping can end the search early, with the best solution so far
+        and the reason instead of "optimal".
+    '''
+    def __init__(self , items : dict , maxWeight : float , incumbent=None , maxNodes : int = None , stopping : StoppingCriteria = None):
+        self.items = items
+        self.maxWeight = maxWeight
+        self.arrays = ItemArrays(items , maxWeight)
+        self.maxNodes = maxNodes
+        self.stopping = stopping
+        if isinstance(incumbent , dict):
+            incumbent = incumbent["solution"]
+        if isinstance(incumbent , list):
+            incumbent = self.arrays.toVector(incumbent)
+        if incumbent is None:
+            incumbent = np.zeros(len(self.arrays.names) , dtype=np.int64)
+        #an incumbent made elsewhere may hold more copies of an item than there are, which can only be cut back
+        self.incumbent = np.minimum(incumbent , self.arrays.amounts)
+
+    def search(self):
+        arrays = self.arrays
+        bound = arrays.upperBound()
+        bestValue = arrays.score(self.incumbent)
+        best = self.incumbent.copy() if bestValue > 0 else np.zeros(len(arrays.names) , dtype=np.int64)
+        order = arrays.ratioOrder()
+        order = order[(arrays.values[order] > 0) & (arrays.maxAmounts[order] > 0)]
+        values = arrays.values[order].tolist()
+        weights = arrays.weights[order].tolist()
+        amounts = arrays.maxAmounts[order].tolist()
+        ratios = [value / weight if weight > 0 else math.inf for value , weight in zip(values , weights)]
+        integral = arrays.values.dtype.kind in 'iu'
+        n = len(order)
+        #prefix sums of every item taken whole, so the relaxation from item k on is a difference and a fraction
+        prefixWeights , prefixValues = [0.0] , [0]
+        for value , weight , amount in zip(values , weights , amounts):
+            prefixWeights.append(prefixWeights[-1] + amount * weight)
+            prefixValues.append(prefixValues[-1] + amount * value)
+
+        quantities = [0] * n
+        depth , value , room = 0 , 0 , self.maxWeight
+        brk = nodes = 0
+        found = None
+        reason = "optimal"
+        while bestValue < bound:
+            #a node is still waiting, so running out of nodes leaves the search unfinished
+            if self.maxNodes is not None and nodes >= self.maxNodes:
+                reason = "nodes"
+                break
+            nodes += 1
+            if depth == n:
+                if value > bestValue:
+                    bestValue , found = value , quantities[:]
+                cut = True
+            else:
+                #brk becomes the last item that still fits whole after the ones before it
+                target = prefixWeights[depth] + room
+                brk = max(brk , depth)
+                while brk < n and prefixWeights[brk + 1] <= target:
+                    brk += 1
+                while brk > depth and prefixWeights[brk] > target:
+                    brk -= 1
+                relaxed = value + prefixValues[brk] - prefixValues[depth]
+                if brk < n:
+                    relaxed += (target - prefixWeights[brk]) * ratios[brk]
+                if integral:
+                    relaxed = math.floor(relaxed + 1e-9)
+                cut = relaxed <= bestValue
+            if cut:
+                #fewer copies of the last item only hand its room to items of lower ratio, which can't raise the relaxation,
+                #so its other branches are cut as well
+                last = depth - 1
+                if last >= 0 and quantities[last]:
+                    value -= quantities[last] * values[last]
+                    room += quantities[last] * weights[last]
+                    quantities[last] = 0
+                last -= 1
+                while last >= 0 and quantities[last] == 0:
+                    last -= 1
+                if last < 0:
+                    break
+                quantities[last] -= 1
+                value -= values[last]
+                room += weights[last]
+                depth = last + 1
+            else:
+                take = amounts[depth] if weights[depth] == 0 else min(amounts[depth] , int((room + 1e-9) // weights[depth]))
+                quantities[depth] = take
+                value += take * values[depth]
+                room -= take * weights[depth]
+                depth += 1
+            #reading the clock is the costly part of the stopping criteria, so they are only checked every 1024 nodes
+            if nodes & 1023 == 0 and self.stopping is not None and self.stopping.check(bestValue , nodes):
+                reason = self.stopping.reason
+                break
+        if found is not None:
+            best = np.zeros(len(arrays.names) , dtype=np.int64)
+            best[order] = found
+        if self.stopping is not None:
+            reason = self.stopping.finish(reason)
+        return {"solution" : arrays.toSolution(best) , "value" : bestValue , "bound" : bestValue if reason == "optimal" else bound , "nodes" : nodes , "stopped" : reason}
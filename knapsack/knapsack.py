@@ -1,16 +1,34 @@
 import argparse
+import os
+import sys
+#the common package shared with the other solver lives at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
 from localsearch import *
+from exact import DynamicProgramming , BranchAndBound
 
 
 
 if __name__ == '__main__':
     #setting up command line arguments
     parser = argparse.ArgumentParser(description="Argument parser for selecting algorithm and file")
-    parser.add_argument("--algorithm" , type=str , help="Define which algorithm to use: hc(hill climbing) , ga(genetic algorithm) , sa(simulated annealing)" , default='ga')
+    parser.add_argument("--algorithm" , type=str , help="Define which algorithm to use: hc(hill climbing) , ga(genetic algorithm) , sa(simulated annealing) , dp(exact dynamic programming) , bb(exact branch and bound)" , default='ga')
     parser.add_argument("--file" , type=str , help="path to a txt file containing the items to solve the knapsack problem for." , default='my-file.txt')
+    parser.add_argument("--trace" , type=str , help="write the value of every iteration to this file (JSON for a .json name, CSV otherwise) and print the counters and phase times" , default=None)
+    
+    parser.add_argument("--deadline" , type=float , help="wall-clock seconds, counted from start-up, after which the search returns its best solution" , default=None)
+    parser.add_argument("--max-evaluations" , type=int , help="stop after this many scored solutions" , default=None)
+    parser.add_argument("--patience" , type=int , help="stop after this many iterations (moves, temperatures or generations) without a better solution" , default=None)
+    parser.add_argument("--target-value" , type=float , help="stop once a solution is worth at least this much" , default=None)
+    parser.add_argument("--stop-at-bound" , action='store_true' , help="stop hc, sa or ga once a solution is worth the fractional upper bound, which proves it optimal")
+    parser.add_argument("--warm-start" , type=str , choices=['hc' , 'ga' , 'none'] , help="heuristic whose solution seeds bb: hc , ga or none" , default='hc')
+    parser.add_argument("--max-nodes" , type=int , help="end bb after this many nodes with the best solution found so far" , default=None)
     
     args = parser.parse_args()
+    instrument = Instrument() if args.trace else None
+    stopping = None
+    if any(value is not None for value in (args.deadline , args.max_evaluations , args.patience , args.target_value)) or args.stop_at_bound:
+        stopping = StoppingCriteria(deadline=args.deadline , max_evaluations=args.max_evaluations , patience=args.patience , target=args.target_value , maximise=True)
 
     #get the total allowed weight and items
     txtFile = open(args.file).read().split('\n')
@@ -24,25 +42,54 @@ if __name__ == '__main__':
         
         items[splitedItem[0]] = {"value" : int(splitedItem[2]) , 'weight' : float(splitedItem[1]) , "availableAmount" : int(splitedItem[3])}        
 
+    if args.stop_at_bound:
+        bound = ItemArrays(items , maxWeight).upperBound()
+        stopping.target = bound if stopping.target is None else min(stopping.target , bound)
+
     #choosing the algorithm based on the argument provided
     if args.algorithm == 'ga':
-        algo = GeneticAlgorithm(popSize=700 , items=items , maxWeight=maxWeight , mutationChance=1 , maxGenerations=600)
+        algo = GeneticAlgorithm(popSize=700 , items=items , maxWeight=maxWeight , mutationChance=1 , maxGenerations=600 , instrument=instrument , stopping=stopping)
         algo.createPopulation()
         ans = algo.search()
         print("*************************")
         print(ans)
 
     elif args.algorithm == 'hc':
-        algo = HillClimbing(items=items , maxWeight=maxWeight , maxTries= 1000)
+        algo = HillClimbing(items=items , maxWeight=maxWeight , maxTries= 1000 , instrument=instrument , stopping=stopping)
         ans = algo.search()
         print("**************************")
         print(ans)
     
     elif args.algorithm == 'sa':
-        algo = SimulatedAnnealing(items=items , maxWeight=maxWeight , coolingRate=0.5 , temp=10000)
+        algo = SimulatedAnnealing(items=items , maxWeight=maxWeight , coolingRate=0.5 , temp=10000 , instrument=instrument , stopping=stopping)
         ans = algo.search()
         print("#########################")
         print(ans)    
     
+    elif args.algorithm == 'dp':
+        algo = DynamicProgramming(items=items , maxWeight=maxWeight)
+        ans = algo.search()
+        print("=========================")
+        print(ans)
+
+    elif args.algorithm == 'bb':
+        incumbent = None
+        if args.warm_start == 'hc':
+            incumbent = HillClimbing(items=items , maxWeight=maxWeight , maxTries= 1000).search()
+        elif args.warm_start == 'ga':
+            warmStart = GeneticAlgorithm(popSize=700 , items=items , maxWeight=maxWeight , mutationChance=1 , maxGenerations=600)
+            warmStart.createPopulation()
+            incumbent = warmStart.search()
+        algo = BranchAndBound(items=items , maxWeight=maxWeight , incumbent=incumbent , maxNodes=args.max_nodes , stopping=stopping)
+        ans = algo.search()
+        print("+++++++++++++++++++++++++")
+        print(ans)
+
     else:
-        print("Unkown algorithm choose. Choose from:  hc(hill climbing) , ga(genetic algorithm) and sa(simulated annealing) ")
\ No newline at end of file
+        print("Unkown algorithm choose. Choose from:  hc(hill climbing) , ga(genetic algorithm) , sa(simulated annealing) , dp(dynamic programming) and bb(branch and bound) ")
+
+    if instrument is not None and instrument.trace:
+        instrument.save(args.trace)
+        summary = instrument.summary()
+        print(f"Trace written to {args.trace}: {summary['iterations']} iterations, {summary['evaluations']} evaluations, {summary['proposed']} proposed, {summary['accepted']} accepted in {summary['seconds']:.2f} seconds")
+        print("Phase seconds: " + ", ".join(f"{phase} {seconds:.3f}" for phase, seconds in summary['phases'].items()))
@@ -1,177 +1,413 @@
-import random , copy , math , csv
+import random , math , csv
 from collections import Counter
+import numpy as np
+from common.instrument import Instrument
+from common.stopping import StoppingCriteria
 
 
 import random
-import copy
+
+class ItemArrays:
+    '''
+        The items dict as NumPy arrays indexed by item position, so a solution is an int vector of quantities
+        and its value and weight are two dot products. names and index map positions to item names and back.
+    '''
+    def __init__(self , items : dict , maxWeight : float):
+        self.names = [*items]
+        self.index = {name : i for i , name in enumerate(self.names)}
+        self.values = np.array([items[name]["value"] for name in self.names])
+        self.weights = np.array([items[name]["weight"] for name in self.names] , dtype=np.float64)
+        self.amounts = np.array([items[name]["availableAmount"] for name in self.names] , dtype=np.int64)
+        self.maxWeight = maxWeight
+        #the most of each item that fits in the empty knapsack
+        fitting = np.floor_divide(maxWeight , self.weights , out=np.full(len(self.names) , np.inf) , where=self.weights > 0)
+        self.maxAmounts = np.minimum(self.amounts , fitting).astype(np.int64)
+
+    def ratioOrder(self):
+        '''Item positions by falling value per unit of weight, weightless items first'''
+        ratios = np.divide(self.values , self.weights , out=np.full(len(self.names) , np.inf) , where=self.weights > 0)
+        return np.argsort(-ratios , kind='stable')
+
+    def upperBound(self):
+        '''
+            Value of the greedy fractional relaxation: whole items by falling value per unit of weight until one doesn't fit,
+            then the fraction of it that does. No solution is worth more, so a search that reaches it
+            (rounded down when the values are whole numbers) has provably found the optimum.
+        '''
+        order = self.ratioOrder()
+        order = order[self.values[order] > 0]
+        weights = (self.maxAmounts * self.weights)[order]
+        values = (self.maxAmounts * self.values)[order]
+        filled = np.cumsum(weights)
+        whole = int(np.searchsorted(filled , self.maxWeight , side='right'))
+        bound = float(values[:whole].sum())
+        if whole < len(order):
+            room = self.maxWeight - (filled[whole - 1] if whole else 0.0)
+            bound += room * self.values[order[whole]] / self.weights[order[whole]]
+        if self.values.dtype.kind in 'iu':
+            return int(math.floor(bound + 1e-9))
+        return bound
+
+    def greedyQuantities(self):
+        '''Items by falling value per unit of weight, as many copies of each as are available and still fit'''
+        quantities = np.zeros(len(self.names) , dtype=np.int64)
+        room = self.maxWeight
+        for i in self.ratioOrder().tolist():
+            if self.values[i] <= 0:
+                continue
+            weight = self.weights[i]
+            quantities[i] = self.amounts[i] if weight <= 0 else min(self.amounts[i] , int((room + 1e-9) // weight))
+            room -= quantities[i] * weight
+        return quantities
+
+    def repair(self , quantities):
+        '''
+            Feasible copy of a quantity vector, or of every row of a population matrix: quantities are cut to what is
+            available and fits, then units are dropped from the lowest value per unit of weight up until each is within maxWeight.
+            Each item drops just enough units to cover the excess (or all it has), one vectorised step over the rows per item.
+        '''
+        quantities = np.minimum(quantities , self.maxAmounts)
+        excess = quantities @ self.weights - self.maxWeight
+        for i in self.ratioOrder()[::-1].tolist():
+            if not np.any(excess > 1e-9):
+                break
+            weight = self.weights[i]
+            if weight <= 0:
+                continue
+            dropped = np.minimum(quantities[... , i] , np.ceil(np.maximum(excess - 1e-9 , 0) / weight)).astype(np.int64)
+            quantities[... , i] -= dropped
+            excess = excess - dropped * weight
+        return quantities
+
+    def scores(self , quantities):
+        '''Value of a quantity vector, or of every row of a population matrix, with overweight solutions worth 0'''
+        #a little slack so that rounding in the weight sum doesn't push an exact fit over the limit
+        return np.where(quantities @ self.weights > self.maxWeight + 1e-9 , 0 , quantities @ self.values)
+
+    def score(self , quantities):
+        return self.scores(quantities).item()
+
+    def weight(self , quantities):
+        return (quantities @ self.weights).item()
+
+    def randomQuantities(self , rng=random):
+        '''Random quantities drawn item by item, each cut down to what still fits next to the items before it'''
+        quantities = np.zeros(len(self.names) , dtype=np.int64)
+        weight = 0.0
+        for i , (amount , itemWeight) in enumerate(zip(self.amounts.tolist() , self.weights.tolist())):
+            potentialAmount = rng.randint(0 , amount)
+            if itemWeight > 0:
+                potentialAmount = min(potentialAmount , int((self.maxWeight - weight) // itemWeight))
+            quantities[i] = max(potentialAmount , 0)
+            weight += quantities[i] * itemWeight
+        return quantities
+
+    def toVector(self , solution : list):
+        '''Quantity vector of a solution given as a list of single item dicts'''
+        quantities = np.zeros(len(self.names) , dtype=np.int64)
+        for item in solution:
+            for name , amount in item.items():
+                quantities[self.index[name]] = amount
+        return quantities
+
+    def toSolution(self , quantities):
+        '''The list of single item dicts the searches report, [{'itemName' : amount}]'''
+        return [{name : int(amount)} for name , amount in zip(self.names , quantities)]
+
+class KnapsackState:
+    '''
+        A quantity vector with running totals of its value and weight, so a move is scored from the items it touches
+        and applied or undone in place, all in O(1) whatever the number of items.
+        Moves are tuples: ('swap', i, j) exchanges the quantities of items i and j, ('step', i, change) adds change to item i,
+        and ('moves', (move, step, ...), valueChange, weightChange) is a move followed by steps, as repair() makes them,
+        carrying the changes they make together.
+    '''
+    def __init__(self , arrays : ItemArrays , quantities):
+        self.arrays = arrays
+        self.maxWeight = arrays.maxWeight
+        self.values = arrays.values.tolist()
+        self.weights = arrays.weights.tolist()
+        self.quantities = np.array(quantities , dtype=np.int64)
+        self.value = (self.quantities @ arrays.values).item()
+        self.weight = (self.quantities @ arrays.weights).item()
+        self.amounts = arrays.maxAmounts.tolist()
+        #weighted items from the lowest value per unit of weight up, the order repair drops units in
+        self.dropOrder = [i for i in arrays.ratioOrder()[::-1].tolist() if self.weights[i] > 0]
+
+    def delta(self , move):
+        '''Changes of the value and the weight that move would make'''
+        if move[0] == 'moves':
+            return move[2] , move[3]
+        if move[0] == 'swap':
+            i , j = move[1] , move[2]
+            #item i gets the quantity of item j and the other way round
+            moved = int(self.quantities[j]) - int(self.quantities[i])
+            return moved * (self.values[i] - self.values[j]) , moved * (self.weights[i] - self.weights[j])
+        i , change = move[1] , move[2]
+        return change * self.values[i] , change * self.weights[i]
+
+    def score(self , move=None):
+        '''Value of the state, or of the state after move, 0 when the knapsack is overweight'''
+        value , weight = self.value , self.weight
+        if move is not None:
+            valueChange , weightChange = self.delta(move)
+            value , weight = value + valueChange , weight + weightChange
+        #the running weight may drift by rounding, which must not push an exact fit over the limit
+        return 0 if weight > self.maxWeight + 1e-9 else value
+
+    def repair(self , move):
+        '''
+            move followed by the steps that make its result feasible: the items it touches are cut back to what is available,
+            then units are dropped from the lowest value per unit of weight up until the knapsack is within maxWeight.
+            move itself when it needs no repair, which is checked in O(1); finding the steps can walk all the items.
+        '''
+        quantities = self.quantities
+        valueChange , weightChange = self.delta(move)
+        if move[0] == 'swap':
+            i , j = move[1] , move[2]
+            after = {i : int(quantities[j]) , j : int(quantities[i])}
+        else:
+            after = {move[1] : int(quantities[move[1]]) + move[2]}
+        weight = self.weight + weightChange
+        overdrawn = [i for i , quantity in after.items() if quantity > self.amounts[i]]
+        if not overdrawn and weight <= self.maxWeight + 1e-9:
+            return move
+        steps = []
+        for i in overdrawn:
+            change = self.amounts[i] - after[i]
+            steps.append(('step' , i , change))
+            after[i] = self.amounts[i]
+            weight += change * self.weights[i]
+        for i in self.dropOrder:
+            excess = weight - self.maxWeight
+            if excess <= 1e-9:
+                break
+            quantity = after.get(i , int(quantities[i]))
+            if quantity:
+                dropped = min(quantity , math.ceil((excess - 1e-9) / self.weights[i]))
+                steps.append(('step' , i , -dropped))
+                weight -= dropped * self.weights[i]
+        for step in steps:
+            valueChange += step[2] * self.values[step[1]]
+            weightChange += step[2] * self.weights[step[1]]
+        return ('moves' , (move , *steps) , valueChange , weightChange)
+
+    def apply(self , move):
+        if move[0] == 'moves':
+            for part in move[1]:
+                self.apply(part)
+            return
+        valueChange , weightChange = self.delta(move)
+        quantities = self.quantities
+        if move[0] == 'swap':
+            i , j = move[1] , move[2]
+            quantities[i] , quantities[j] = quantities[j] , quantities[i]
+        else:
+            quantities[move[1]] += move[2]
+        self.value += valueChange
+        self.weight += weightChange
+
+    def undo(self , move):
+        '''Takes back move, applied last'''
+        if move[0] == 'moves':
+            for part in reversed(move[1]):
+                self.undo(part)
+        elif move[0] == 'swap':
+            self.apply(move)
+        else:
+            self.apply(('step' , move[1] , -move[2]))
 
 class GeneticAlgorithm:
-    def __init__(self, popSize: int, items: dict, maxWeight: float, maxGenerations: int = 2000, elitPortion: float = 0.5, mutationChance: float = 0.3):
-        self.population = []
+    def __init__(self, popSize: int, items: dict, maxWeight: float, maxGenerations: int = 2000, elitPortion: float = 0.5, mutationChance: float = 0.3, instrument: Instrument = None, stopping: StoppingCriteria = None, seed: int = None):
+        # the population is a (popSize, items) matrix of quantities
+        self.population = None
         self.popSize = popSize
         self.maxGenerations = maxGenerations
         self.elitPortion = elitPortion
         self.mutationChance = mutationChance
         self.maxWeight = maxWeight
-        # making sure that the same parent isn't selected twice, making it fair
-        self.selectedAsParents = []
         # dictionary of items with their value, weight, and available amount
         self.items = items
+        self.arrays = ItemArrays(items, maxWeight)
+        self.rng = np.random.default_rng(seed)
         # current global high
         self.globalMax = {"solution": [], "value": 0, "generation": 0}
+        # improving generations only, every generation goes to the instrument's trace when one is given
         self.visited = []
+        self.instrument = instrument
+        # extra reasons to end the search early, checked after every generation
+        self.stopping = stopping
 
     def search(self):
-        newPopulation = self.population
+        population = self.population
         generations = 0
+        evaluations = 0
+        reason = "generations"
+        instrument = self.instrument
 
         while generations <= self.maxGenerations:
-            fitPopulation = []
-
-            # calculating and arranging the populations fitness
-            for item in newPopulation:
-                fitPopulation.append(
-                    (item, self.fitness(solution=item))
-                )
-            fitPopulation.sort(key=lambda a: a[1], reverse=True)
-            
+            # scoring the whole population with one matrix-vector product and arranging it by fitness
+            if instrument is not None:
+                instrument.enter('scoring')
+                instrument.evaluations += len(population)
+            fitness = self.fitness(population)
+            if instrument is not None:
+                instrument.switch('selection')
+            order = np.argsort(-fitness, kind='stable')
+
             # print out the current best solution before creating new children
-            currentBestValue = fitPopulation[0][1]
+            currentBestValue = fitness[order[0]].item()
 
             # holding a global maximum, not to lose it to mutation or reproduction
             if self.globalMax["value"] < currentBestValue:
-                bestPath = copy.deepcopy(fitPopulation[0][0])
+                bestPath = self.arrays.toSolution(population[order[0]])
                 self.globalMax = {"solution": bestPath, "value": currentBestValue, "generation": generations}
-                
-               
-
                 self.visited.append([generations, currentBestValue])
 
             # elit portion of the population
-            elitSize = int(len(fitPopulation) * self.elitPortion)
-            elitPop = [x[0] for x in fitPopulation[:elitSize]]
+            elitSize = int(len(population) * self.elitPortion)
+            elitPop = population[order[:elitSize]]
 
             # select parents from the elit population to reproduce and fill back the population
-            for i in range(elitSize):
-                male, female = self.selectParents(population=elitPop)
-                child = self.reproduce(male, female)
-                elitPop.append(child)
-
-            newPopulation = [x for x in elitPop]
-            self.selectedAsParents = []
+            males, females = self.selectParents(elitSize, elitSize)
+            if instrument is not None:
+                instrument.switch('neighbours')
+            children = self.reproduce(elitPop[males], elitPop[females])
+            population = np.concatenate((elitPop, children))
+            if instrument is not None:
+                instrument.leave()
+                instrument.proposed += elitSize
+                instrument.accepted += elitSize
+                instrument.iteration(generations, currentBestValue, self.globalMax["value"])
+            evaluations += len(fitness)
             generations += 1
+            if self.stopping is not None and self.stopping.check(self.globalMax["value"], evaluations):
+                break
 
+        self.population = population
+        if self.stopping is not None:
+            reason = self.stopping.finish(reason)
+        self.globalMax["stopped"] = reason
         return self.globalMax
 
-    def fitness(self, solution: list):
-        total_value = 0
-        total_weight = 0
-        for item in solution:
-            item_name, item_quantity = list(item.items())[0]
-            total_value += self.items[item_name]['value'] * item_quantity
-            total_weight += self.items[item_name]['weight'] * item_quantity
-        if total_weight > self.maxWeight:
-            return 0
-        else:
-            return total_value
+    def fitness(self, population):
+        # value of every row, 0 for the overweight ones
+        return self.arrays.scores(population)
 
     def createPopulation(self):
         # generate potential solutions (population) - about 10,000 of them
-        solutions = []
-        count = 0
-        while count < self.popSize:
-            solution = []
-            for item_name, item_details in self.items.items():
-                max_item_amount = min(item_details["availableAmount"], int(self.maxWeight / item_details["weight"]))
-                solution.append({item_name: random.randint(0, max_item_amount)})
-            solutions.append(solution)
-            count += 1
-        self.population = solutions
-
-    def selectParents(self, population):
-        x = random.randint(0, len(population) - 1)
-        while True:
-            y = random.randint(0, len(population) - 1)
-            if x != y:
-                return population[x], population[y]
-
-    def reproduce(self, parent_one, parent_two):
-        cutting_point = random.randint(0, len(parent_one) - 1)
-        child = parent_one[:cutting_point] + parent_two[cutting_point:]
-        if random.random() < self.mutationChance:
-            return self.mutate(child)
-        return child
-
-    def mutate(self, child):
-        copied = copy.deepcopy(child)
-        for item_index, item in enumerate(copied):
-            item_name, item_quantity = list(item.items())[0]
-            max_amount = min(self.items[item_name]["availableAmount"], int(self.maxWeight / self.items[item_name]["weight"]))
-            if item_quantity > max_amount:
-                copied[item_index][item_name] = max_amount
-        return copied
+        if self.instrument is not None:
+            with self.instrument.phase('init'):
+                return self.__createPopulation()
+        self.__createPopulation()
+
+    def __createPopulation(self):
+        # every quantity uniform between 0 and the most of the item that fits on its own, repaired to fit together,
+        # and the greedy solution as the first individual
+        population = self.rng.integers(0, self.arrays.maxAmounts + 1, size=(self.popSize, len(self.arrays.names)))
+        population = self.arrays.repair(population)
+        population[0] = self.arrays.greedyQuantities()
+        self.population = population
+
+    def selectParents(self, populationSize, count):
+        # indices of count parent pairs, the two parents of a pair always being different individuals
+        if populationSize < 2:
+            raise ValueError(f"Need at least two parents to reproduce, the elite has {populationSize}")
+        males = self.rng.integers(0, populationSize, size=count)
+        females = (males + self.rng.integers(1, populationSize, size=count)) % populationSize
+        return males, females
+
+    def reproduce(self, males, females):
+        # one point crossover of every pair of parent rows, then mutation of a mutationChance share of the children,
+        # then every child is repaired so no overweight child is ever scored
+        cuttingPoints = self.rng.integers(0, males.shape[1], size=len(males))
+        children = np.where(np.arange(males.shape[1]) < cuttingPoints[:, None], males, females)
+        mutated = self.rng.random(len(children)) < self.mutationChance
+        children[mutated] = self.mutate(children[mutated])
+        return self.arrays.repair(children)
+
+    def mutate(self, children):
+        # caps every quantity at the most of the item that fits in the knapsack
+        return np.minimum(children, self.arrays.maxAmounts)
 
 
 
 class HillClimbing:
-    def __init__(self , items : dict , maxWeight : float , maxTries : int = 1000):
+    def __init__(self , items : dict , maxWeight : float , maxTries : int = 1000 , instrument : Instrument = None , stopping : StoppingCriteria = None):
         self.items = items
         self.maxWeight = maxWeight
         self.maxTries = maxTries
         self.currentSol = None
         self.visited = []
+        #solutions are quantity vectors over the positions of arrays
+        self.arrays = ItemArrays(items , maxWeight) if items is not None else None
+        self.instrument = instrument
+        #extra reasons to end the search early, checked after every move
+        self.stopping = stopping
+        self.evaluations = 0
 
     def search(self):
         count = 0
-        self.currentSol = self.generateSol()
-        best_solution = {"solution": self.currentSol, "value": self.stateSocre(self.currentSol)}
+        iteration = 0
+        instrument = self.instrument
+        if instrument is not None:
+            instrument.enter('init')
+        self.currentSol = KnapsackState(self.arrays , self.generateSol())
+        best_solution = {"solution": self.currentSol.quantities.copy(), "value": self.stateSocre(self.currentSol)}
+        if instrument is not None:
+            instrument.leave()
         while count <= self.maxTries:
-            neighbor = self.getNeighbor(self.currentSol)
+            if instrument is not None:
+                instrument.enter('neighbours')
+            move , newEnergy = self.getNeighbor(self.currentSol)
             oldEnergy = self.stateSocre(self.currentSol)
-            newEnergy = self.stateSocre(neighbor)
+            if instrument is not None:
+                instrument.switch('selection')
+                instrument.proposed += 1
 
             if oldEnergy < newEnergy:
-                self.currentSol = copy.deepcopy(neighbor)
-                current_value = self.stateSocre(self.currentSol)
+                #moved in place, only a new best is copied out
+                self.currentSol.apply(move)
+                current_value = newEnergy
                 if current_value > best_solution["value"]:
-                    best_solution = {"solution": self.currentSol, "value": current_value}
+                    best_solution = {"solution": self.currentSol.quantities.copy(), "value": current_value}
                 count = 0
+                if instrument is not None:
+                    instrument.accepted += 1
             else:
                 count += 1
-                
+            if instrument is not None:
+                instrument.leave()
+                instrument.iteration(iteration, max(oldEnergy, newEnergy), best_solution["value"])
+            iteration += 1
+            if self.stopping is not None and self.stopping.check(best_solution["value"], self.evaluations):
+                break
+
+        #maxTries moves in a row without a better neighbour
+        reason = "tries"
+        if self.stopping is not None:
+            reason = self.stopping.finish(reason)
+        best_solution["solution"] = self.arrays.toSolution(best_solution["solution"])
+        best_solution["stopped"] = reason
         return best_solution
 
 
 
-    def stateSocre(self , solution):
-        total_value = 0
-        total_weight = 0
-        itemsInSolution = [[*x].pop() for x in solution]
-        for item in itemsInSolution:
-            index = itemsInSolution.index(item)
-            total_value += self.items[item]['value'] * solution[index][item]
-            total_weight += self.items[item]['weight'] * solution[index][item]
-        if total_weight > self.maxWeight:
-            return 0
-        else:
-            return total_value
+    def stateSocre(self , solution , move=None):
+        self.evaluations += 1
+        if self.instrument is not None:
+            self.instrument.evaluations += 1
+            with self.instrument.phase('scoring'):
+                return self.__stateScore(solution , move)
+        return self.__stateScore(solution , move)
+
+    def __stateScore(self , solution , move=None):
+        #the running totals of a KnapsackState, moved by the O(1) delta of move when one is given
+        return solution.score(move)
 
     def generateSol(self):
         '''We generate a random solution'''
-        items = [*self.items]
-        weight = 0
-        potentialWeight = 0
-        sol = []
-        for item in items:
-            potentialAmount = random.randint(0 , self.items[item]["availableAmount"])
-            potentialWeight = weight + (potentialAmount * self.items[item]["weight"]) 
-            while potentialWeight > self.maxWeight and potentialAmount > 0:
-                potentialAmount -= 1
-                potentialWeight = weight + (potentialAmount * self.items[item]["weight"])
-            potentialAmount = 0 if potentialAmount < 0 else potentialAmount
-            sol.append({item : potentialAmount})
-            weight += potentialAmount * self.items[item]["weight"]
-        return sol
+        return self.arrays.randomQuantities()
     
     def getNeighbor(self , state):
         '''
@@ -179,75 +415,92 @@ class HillClimbing:
                 - Swapping the amounts between two items
                 - Decrementing/incrementing the amount between items
             One of the two is choosen based on a probability , 70% of the time we swap amounts and 30% of the time we either increment/decrement them(50% chance of either happening)
+            The neighbours are moves scored against the state's running totals, nothing is copied,
+            each repaired so that it never leads to an overweight state; returns the best move and the value it leads to.
         '''
         neighbors = []
         #generate 10 neighbours 
+        quantities = state.quantities
         for i in range(10):
-            copied = copy.deepcopy(state)
             if random.random() < .98:
                 #swaping is chosen
-                itemOne = random.randint(0 , (len(state) - 1))
-                itemTwo = random.randint(0 , (len(state) - 1))
+                itemOne = random.randint(0 , (len(quantities) - 1))
+                itemTwo = random.randint(0 , (len(quantities) - 1))
                 while itemOne == itemTwo:
-                    itemTwo = random.randint(0 , (len(state) - 1))
+                    itemTwo = random.randint(0 , (len(quantities) - 1))
 
-                #we did this because our solution is a list of dictionaries , [{'itemName' : amount}]
-                itemOneName = [*copied[itemOne]].pop()
-                itemTwoName = [*copied[itemTwo]].pop()
-
-                copied[itemOne][itemOneName] , copied[itemTwo][itemTwoName] = copied[itemTwo][itemTwoName] , copied[itemOne][itemOneName]
-                neighbors.append((copied , self.stateSocre(copied))) 
+                move = state.repair(('swap' , itemOne , itemTwo))
+                neighbors.append((move , self.stateSocre(state , move))) 
 
             else:
                 done = False
                 while not done:
                     #incrementing/decrementing is chosen
-                    selectedItem = random.randint(0 , (len(state) - 1))
+                    selectedItem = random.randint(0 , (len(quantities) - 1))
                     if random.random() < 0.58:
                         #choose increment
-                        itemName = [*copied[selectedItem]].pop()
-                        maxAmount = self.items[itemName]["availableAmount"]
-                        if (copied[selectedItem][itemName] + 1) < maxAmount: 
-                            copied[selectedItem][itemName] += 1
+                        maxAmount = self.arrays.amounts[selectedItem]
+                        if (quantities[selectedItem] + 1) < maxAmount: 
+                            move = ('step' , selectedItem , 1)
                             done = True
                     else:
                         #choose decrement
-                        itemName = [*copied[selectedItem]].pop()
-                        if (copied[selectedItem][itemName] - 1) > 0:
-                            copied[selectedItem][itemName] -= 1
+                        if (quantities[selectedItem] - 1) > 0:
+                            move = ('step' , selectedItem , -1)
                             done = True
-                neighbors.append((copied , self.stateSocre(copied)))
+                move = state.repair(move)
+                neighbors.append((move , self.stateSocre(state , move)))
         
         #order them form best to worst
         neighbors.sort(key= lambda a : a[1] , reverse=True)
         #return the best
-        return neighbors[0][0]
+        return neighbors[0]
 
 class SimulatedAnnealing:
     '''This is a variant of Hill-Climbing algorithm that occasionally accepts bad solutions in the hopes of getting a better solution.'''
-    def __init__(self , maxWeight : float , temp : float = 100 , coolingRate : float = 0.01 , items : dict = None):
+    def __init__(self , maxWeight : float , temp : float = 100 , coolingRate : float = 0.01 , items : dict = None , instrument : Instrument = None , stopping : StoppingCriteria = None):
         self.items = items
         self.maxWeight = maxWeight
         self.temp = temp
         self.coolingRate = coolingRate
         self.bestSol = None
         self.visited = []
+        #solutions are quantity vectors over the positions of arrays
+        self.arrays = ItemArrays(items , maxWeight) if items is not None else None
+        self.instrument = instrument
+        #extra reasons to end the search early, checked at every temperature
+        self.stopping = stopping
+        self.evaluations = 0
 
     def search(self):
-        self.currentSol = self.generateSol()
-        self.bestSol = self.currentSol
+        iteration = 0
+        instrument = self.instrument
+        if instrument is not None:
+            instrument.enter('init')
+        self.currentSol = KnapsackState(self.arrays , self.generateSol())
+        self.bestSol = self.currentSol.quantities.copy()
+        bestValue = self.stateSocre(self.currentSol)
+        if instrument is not None:
+            instrument.leave()
         while self.temp > 1:
             #generate neighbour
-            neighbor = self.getNeighbor(self.currentSol)
+            if instrument is not None:
+                instrument.enter('neighbours')
+            move , newEnergy = self.getNeighbor(self.currentSol)
             
             oldEnergy = self.stateSocre(self.currentSol)
-            newEnergy = self.stateSocre(neighbor)
+            if instrument is not None:
+                instrument.switch('selection')
+                instrument.proposed += 1
+            accepted = False
 
-            #if neighbour is better than current exchange
+            #if neighbour is better than current exchange, in place
             if oldEnergy < newEnergy:
-                self.currentSol = copy.deepcopy(neighbor)
-                if self.stateSocre(self.currentSol) > self.stateSocre(self.bestSol):
-                    self.bestSol = copy.deepcopy(neighbor)
+                self.currentSol.apply(move)
+                accepted = True
+                if newEnergy > bestValue:
+                    self.bestSol = self.currentSol.quantities.copy()
+                    bestValue = newEnergy
             else:
                 #which is negative at this point
                 delta = newEnergy - oldEnergy
@@ -255,44 +508,39 @@ class SimulatedAnnealing:
                     try:
                         probability = math.e ** (-delta/self.temp)
                         if random.random() < probability:
-                            self.currentSol = copy.deepcopy(neighbor)
+                            self.currentSol.apply(move)
+                            accepted = True
                     except Exception as e:
                         pass
+            if instrument is not None:
+                instrument.leave()
+                instrument.accepted += accepted
+                instrument.iteration(iteration, newEnergy if accepted else oldEnergy, bestValue, temperature=self.temp)
+            iteration += 1
             self.temp -= (1- self.coolingRate)
+            if self.stopping is not None and self.stopping.check(bestValue, self.evaluations):
+                break
 
-        return {"solution" : self.bestSol , "value" : self.stateSocre(self.bestSol)}
+        reason = "temperature"
+        if self.stopping is not None:
+            reason = self.stopping.finish(reason)
+        return {"solution" : self.arrays.toSolution(self.bestSol) , "value" : bestValue , "stopped" : reason}
     
-    def stateSocre(self , solution):
-        total_value = 0
-        total_weight = 0
-        itemsInSolution = [[*x].pop() for x in solution]
-        for item in itemsInSolution:
-            index = itemsInSolution.index(item)
-            total_value += self.items[item]['value'] * solution[index][item]
-            total_weight += self.items[item]['weight'] * solution[index][item]
-        if total_weight > self.maxWeight:
-            return 0
-        else:
-            return total_value
+    def stateSocre(self , solution , move=None):
+        self.evaluations += 1
+        if self.instrument is not None:
+            self.instrument.evaluations += 1
+            with self.instrument.phase('scoring'):
+                return self.__stateScore(solution , move)
+        return self.__stateScore(solution , move)
+
+    def __stateScore(self , solution , move=None):
+        #the running totals of a KnapsackState, moved by the O(1) delta of move when one is given
+        return solution.score(move)
         
     def generateSol(self):
-        
-        items = [*self.items]
-        weight = 0
-        potentialWeight = 0
-        sol = []
         '''We generate a random solution'''
-        for item in items:
-            potentialAmount = random.randint(0 , self.items[item]["availableAmount"])
-            potentialWeight = weight + (potentialAmount * self.items[item]["weight"]) 
-            while potentialWeight > self.maxWeight and potentialAmount > 0:
-                potentialAmount -= 1
-                potentialWeight = weight + (potentialAmount * self.items[item]["weight"])
-            potentialAmount = 0 if potentialAmount < 0 else potentialAmount
-            sol.append({item : potentialAmount})
-            weight += potentialAmount * self.items[item]["weight"]
-        
-        return sol
+        return self.arrays.randomQuantities()
     
     def getNeighbor(self , state):
         '''
@@ -300,49 +548,46 @@ class SimulatedAnnealing:
                 - Swapping the amounts between two items
                 - Decrementing/incrementing the amount between items
             One of the two is choosen based on a probability , 70% of the time we swap amounts and 30% of the time we either increment/decrement them(50% chance of either happening)
+            The neighbours are moves scored against the state's running totals, nothing is copied,
+            each repaired so that it never leads to an overweight state; returns the best move and the value it leads to.
         '''
         
         neighbors = []
         #generate 10 neighbours 
+        quantities = state.quantities
         for i in range(10):
-            copied = copy.deepcopy(state)
             if random.random() < .58:
                 #swaping is chosen
-                itemOne = random.randint(0 , (len(state) - 1))
-                itemTwo = random.randint(0 , (len(state) - 1))
+                itemOne = random.randint(0 , (len(quantities) - 1))
+                itemTwo = random.randint(0 , (len(quantities) - 1))
                 while itemOne == itemTwo:
-                    itemTwo = random.randint(0 , (len(state) - 1))
-
-                #we did this because our solution is a list of dictionaries , [{'itemName' : amount}]
-                itemOneName = [*copied[itemOne]].pop()
-                itemTwoName = [*copied[itemTwo]].pop()
+                    itemTwo = random.randint(0 , (len(quantities) - 1))
 
-                copied[itemOne][itemOneName] , copied[itemTwo][itemTwoName] = copied[itemTwo][itemTwoName] , copied[itemOne][itemOneName]
-                neighbors.append((copied , self.stateSocre(copied))) 
+                move = state.repair(('swap' , itemOne , itemTwo))
+                neighbors.append((move , self.stateSocre(state , move))) 
 
             else:
                 done = False
                 while not done:
                     #incrementing/decrementing is chosen
-                    selectedItem = random.randint(0 , (len(state) - 1))
+                    selectedItem = random.randint(0 , (len(quantities) - 1))
                     if random.random() < 0.68:
                         #choose increment
-                        itemName = [*copied[selectedItem]].pop()
-                        maxAmount = self.items[itemName]["availableAmount"]
-                        if (copied[selectedItem][itemName] + 1) < maxAmount: 
-                            copied[selectedItem][itemName] += 1
+                        maxAmount = self.arrays.amounts[selectedItem]
+                        if (quantities[selectedItem] + 1) < maxAmount: 
+                            move = ('step' , selectedItem , 1)
                             done = True
                     else:
                         #choose decrement
-                        itemName = [*copied[selectedItem]].pop()
-                        if (copied[selectedItem][itemName] - 1) > 0:
-                            copied[selectedItem][itemName] -= 1
+                        if (quantities[selectedItem] - 1) > 0:
+                            move = ('step' , selectedItem , -1)
                             done = True
-                neighbors.append((copied , self.stateSocre(copied)))
+                move = state.repair(move)
+                neighbors.append((move , self.stateSocre(state , move)))
         
         #order them form best to worst
         neighbors.sort(key= lambda a : a[1] , reverse=True)
         #return the best
-        return neighbors[0][0]
+        return neighbors[0]
     
 
@@ -1,130 +1,283 @@
-import time
 import argparse
-from hill import get_initial_path, hill_climbing
-from genetic import genetic_algorithm
-from simulated import simulated_annealing
-from graph import Graph
-
-def read_cities_from_file(filename):
-    cities = {}
-    try:
-        with open(filename, 'r') as file:
-            for line in file:
-                parts = line.strip().split()
-                if len(parts) == 3:
-                    name = parts[0]
-                    latitude = float(parts[1])
-                    longitude = float(parts[2])
-                    cities[name] = (latitude, longitude)
-                else:
-                    print(f"Ignoring improperly formatted line: {line}")
-    except FileNotFoundError:
-        print(f"File '{filename}' not found.")
-    except Exception as e:
-        print(f"Error reading file '{filename}': {str(e)}")
-    return cities
-
-def add_edges_from_file(graph, filename):
-    cities = read_cities_from_file(filename)
-    for city1 in cities:
-        for city2 in cities:
-            if city1 != city2:
-                lat1, lon1 = cities[city1]
-                lat2, lon2 = cities[city2]
-                # Calculating distance using Haversine formula
-                distance = haversine(lon1, lat1, lon2, lat2)
-                graph.addEdge(city1, city2, distance)
-
-def haversine(lon1, lat1, lon2, lat2):
-    from math import radians, sin, cos, sqrt, atan2
-
-    # Convert decimal degrees to radians
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    radius_of_earth = 6371  # in kilometers
-    distance = radius_of_earth * c
-    return distance
-
-def tsp_fitness(path, graph):
-    distance = 0
-    for i in range(len(path) - 1):
-        current_node = path[i]
-        next_node = path[i + 1]
-        neighbors = graph.getNeighbours(current_node)
-        edge_weight = None
-        for neighbor, weight in neighbors:
-            if neighbor == next_node:
-                edge_weight = weight
-                break
-        if edge_weight is None:
-            raise ValueError(f"No edge between {current_node} and {next_node}")
-        distance += edge_weight
-    return distance
+import csv
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+import zlib
+import numpy as np
+from graph import MatrixGraph, LazyGraph
+from loader import load_graph
+from construct import space_filling_curve_tour
+from spatial import candidate_lists
+from moves import move_search, steepest_two_opt
+from simulated import simulated_annealing_moves
+from genetic import genetic_algorithm_array
+from tour import two_opt_search
+from lk import lk_search
+from bound import held_karp_bound
+from exact import exact_tour
+
+SIDE = 1000.0
+SIZES = [100, 1000, 10000, 100000]
+KINDS = ['uniform', 'clustered']
+#metric: True when a larger value is worse
+METRICS = {
+    "wall_seconds": True,
+    "cpu_seconds": True,
+    "peak_rss_mb": True,
+    "evaluations_per_second": False,
+    "cost": True,
+}
+
+def uniform_instance(n, rng):
+    '''n cities drawn uniformly from a SIDE x SIDE square'''
+    return rng.random((n, 2)) * SIDE
+
+def clustered_instance(n, rng):
+    '''DIMACS style clustered cities: n / 100 centres drawn uniformly, every city normally spread around one of them'''
+    centres = rng.random((max(1, n // 100), 2)) * SIDE
+    spread = SIDE / np.sqrt(n)
+    return centres[rng.integers(0, len(centres), n)] + rng.normal(0, spread, (n, 2))
+
+INSTANCES = {
+    'uniform': uniform_instance,
+    'clustered': clustered_instance,
+}
+
+def euclidean_matrix(points):
+    squares = (points * points).sum(axis=1)
+    dist = squares[:, None] + squares[None, :] - 2 * points @ points.T
+    np.maximum(dist, 0, out=dist)
+    np.sqrt(dist, out=dist)
+    np.fill_diagonal(dist, 0)
+    return dist
+
+def euclidean_pairs(x1, y1, x2, y2):
+    return np.hypot(x1 - x2, y1 - y2)
+
+def instance_seed(seed, kind, size):
+    '''Seed of the instance of a kind and size, shared by every solver and repeat'''
+    return [seed, zlib.crc32(kind.encode()), size]
+
+def instance_graph(kind, size, seed, dense_limit):
+    '''
+        Generates (or, for kind 'file:<path>', loads) an instance. Up to dense_limit cities it is a MatrixGraph,
+        above that a LazyGraph computing Euclidean distances on demand.
+    '''
+    if kind.startswith('file:'):
+        return load_graph(kind[5:])
+    points = INSTANCES[kind](size, np.random.default_rng(instance_seed(seed, kind, size)))
+    names = [str(i) for i in range(size)]
+    if size <= dense_limit:
+        return MatrixGraph.fromMatrix(names, euclidean_matrix(points), planar=points)
+    graph = LazyGraph(names, points, euclidean_pairs)
+    graph.planar = points
+    return graph
+
+def reference_cost(graph, exact_limit=20):
+    '''The optimum for tiny instances, otherwise the Held-Karp lower bound, over a dense copy of a LazyGraph's distances'''
+    n = graph.numOfNodes()
+    if n <= exact_limit:
+        return exact_tour(graph)[1], 'optimum'
+    dist = graph.dist
+    if not isinstance(dist, np.ndarray):
+        ids = np.arange(n)
+        dist = dist[ids[:, None], ids[None, :]]
+    return held_karp_bound(dist, graph.idTourCost(space_filling_curve_tour(graph))), 'bound'
+
+def start_route(graph):
+    return graph.toNames(space_filling_curve_tour(graph))
+
+def run_ha(graph, seed, stats):
+    '''First-improvement 2-opt/Or-opt/swap moves over candidate lists, 10 epochs from a Hilbert curve tour'''
+    return move_search(graph, start_route(graph), 10, rng=random.Random(seed), candidates=candidate_lists(graph), stats=stats)[1]
+
+def run_sa(graph, seed, stats):
+    '''Annealing over candidate list moves from a Hilbert curve tour, cooling from the mean candidate edge down a thousandfold'''
+    candidates = candidate_lists(graph)
+    start_temp = float(np.mean(graph.dist[np.arange(graph.numOfNodes()), candidates[:, 0]]))
+    return simulated_annealing_moves(start_route(graph), start_temp, start_temp / 1000, 0.95, 10000, graph,
+                                     rng=random.Random(seed), candidates=candidates, stats=stats)[1]
+
+def run_twoopt(graph, seed, stats):
+    '''Neighbour list 2-opt on a two-level list tour, to a local optimum from a Hilbert curve tour'''
+    return two_opt_search(graph, start_route(graph), candidates=candidate_lists(graph), stats=stats)[1]
+
+def run_steepest(graph, seed, stats):
+    '''Vectorised best-improvement 2-opt to a local optimum from a Hilbert curve tour'''
+    return steepest_two_opt(graph, start_route(graph), stats=stats)[1]
+
+def run_lk(graph, seed, stats):
+    '''Or-opt and LK style moves to a local optimum from a Hilbert curve tour'''
+    return lk_search(graph, start_route(graph), candidates=candidate_lists(graph), rng=random.Random(seed), stats=stats)[1]
+
+def run_ga(graph, seed, stats):
+    '''Array genetic algorithm with OX, 50 individuals over 200 generations'''
+    _, _, population = genetic_algorithm_array(graph, population_size=50, generations=200, seed=seed, stats=stats)
+    return graph.idTourCost(population[np.argmin([graph.idTourCost(tour) for tour in population])])
+
+#name: (run function, largest instance it is run on, needs a dense matrix)
+SOLVERS = {
+    'ha': (run_ha, 100000, False),
+    'twoopt': (run_twoopt, 100000, False),
+    'lk': (run_lk, 10000, False),
+    'sa': (run_sa, 10000, False),
+    'steepest': (run_steepest, 2000, True),
+    'ga': (run_ga, 1000, True),
+}
+
+def run_once(task):
+    '''One seeded run in a fresh worker process, so that its peak RSS is its own'''
+    solver, kind, size, seed, repeat, dense_limit, reference = task
+    setup = time.perf_counter()
+    graph = instance_graph(kind, size, seed, dense_limit)
+    setup = time.perf_counter() - setup
+    stats = {}
+    wall, cpu = time.perf_counter(), time.process_time()
+    cost = SOLVERS[solver][0](graph, seed + repeat, stats)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    evaluations = stats.get("evaluations")
+    return {
+        "solver": solver,
+        "kind": kind,
+        "size": graph.numOfNodes(),
+        "repeat": repeat,
+        "seed": seed + repeat,
+        "setup_seconds": setup,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "evaluations": evaluations,
+        "evaluations_per_second": evaluations / wall if evaluations is not None and wall > 0 else None,
+        "cost": float(cost),
+        "gap": float(cost) / reference[0] - 1 if reference else None,
+        "reference": reference[1] if reference else None,
+    }
+
+def summarise(runs):
+    '''Median and 95th percentile of every metric, per solver, kind and size'''
+    groups = {}
+    for run in runs:
+        groups.setdefault((run["solver"], run["kind"], run["size"]), []).append(run)
+    summary = []
+    for (solver, kind, size), group in groups.items():
+        row = {"solver": solver, "kind": kind, "size": size, "runs": len(group)}
+        for metric in list(METRICS) + ["gap"]:
+            values = [run[metric] for run in group if run.get(metric) is not None]
+            if values:
+                row[metric + "_median"] = float(np.median(values))
+                row[metric + "_p95"] = float(np.percentile(values, 95))
+        summary.append(row)
+    return summary
+
+def compare(summary, baseline, tolerance, cost_tolerance):
+    '''
+        Compares the medians of summary against a baseline summary.
+        Returns (message, is_regression) pairs for every metric that moved beyond its tolerance,
+        cost_tolerance for tour cost and tolerance for the rest.
+    '''
+    previous = {(row["solver"], row["kind"], row["size"]): row for row in baseline}
+    changes = []
+    for row in summary:
+        old = previous.get((row["solver"], row["kind"], row["size"]))
+        if old is None:
+            continue
+        for metric, larger_is_worse in METRICS.items():
+            key = metric + "_median"
+            if row.get(key) is None or not old.get(key):
+                continue
+            change = row[key] / old[key] - 1
+            limit = cost_tolerance if metric == "cost" else tolerance
+            if abs(change) <= limit:
+                continue
+            worse = change > 0 if larger_is_worse else change < 0
+            label = "REGRESSION" if worse else "improvement"
+            changes.append((f"{label}: {row['solver']} {row['kind']} {row['size']} {metric} {old[key]:.4g} -> {row[key]:.4g} ({100 * change:+.1f}%)", worse))
+    return changes
+
+def write_csv(filename, rows):
+    fields = list(dict.fromkeys(key for row in rows for key in row))
+    with open(filename, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def run_suite(solvers, kinds, sizes, repeats, seed, dense_limit, bound_limit):
+    '''Runs every solver on every instance it supports, one worker process per run and one run at a time'''
+    tasks = []
+    for kind in kinds:
+        for size in sizes:
+            reference = None
+            if kind.startswith('file:') or size <= bound_limit:
+                graph = instance_graph(kind, size, seed, dense_limit)
+                size = graph.numOfNodes()
+                if size <= bound_limit:
+                    reference = reference_cost(graph)
+            for solver in solvers:
+                _, largest, dense = SOLVERS[solver]
+                if size > largest or (dense and size > dense_limit):
+                    continue
+                tasks.extend((solver, kind, size, seed, repeat, dense_limit, reference) for repeat in range(repeats))
+    runs = []
+    with multiprocessing.get_context('spawn').Pool(processes=1, maxtasksperchild=1) as pool:
+        for run in pool.imap(run_once, tasks):
+            print(f"{run['solver']:>8} {run['kind']:>9} {run['size']:>7} #{run['repeat']}: cost {run['cost']:.2f} in {run['wall_seconds']:.3f}s wall, "
+                  f"{run['cpu_seconds']:.3f}s cpu, {run['peak_rss_mb']:.0f} MB")
+            runs.append(run)
+    return runs
 
 def main():
-    parser = argparse.ArgumentParser(description='Compare TSP Solvers')
-    parser.add_argument('--file', help='Path to the cities file')
+    parser = argparse.ArgumentParser(description='Benchmark the TSP solvers on generated instances over seeded repeats')
+    parser.add_argument('--solvers', nargs='+', choices=list(SOLVERS), default=list(SOLVERS), help='Solvers to run')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS, help='Instance distributions to generate')
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='Numbers of cities (each solver skips sizes above its limit)')
+    parser.add_argument('--file', help='Benchmark on a cities or TSPLIB file instead of generated instances')
+    parser.add_argument('--repeats', type=int, default=5, help='Seeded repeats of every solver on every instance')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the instances and the first repeat')
+    parser.add_argument('--dense-limit', type=int, default=5000, help='Largest instance given a full distance matrix, larger ones compute distances on demand')
+    parser.add_argument('--bound-limit', type=int, default=1000, help='Largest instance whose Held-Karp bound is computed to report optimality gaps')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file for the runs and their summary')
+    parser.add_argument('--csv', help='Also write the runs to this CSV file, and the summary next to it')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--compare', help='Compare this JSON results file against --baseline instead of running')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative change of time, memory or throughput medians flagged by the comparison')
+    parser.add_argument('--cost-tolerance', type=float, default=0.01, help='Relative change of the median tour cost flagged by the comparison')
     args = parser.parse_args()
 
-    if args.file:
-        cities_graph = Graph()
-        add_edges_from_file(cities_graph, args.file)
-
-        cities = list(cities_graph.map.keys())
-
-        algorithms = [
-            ('Hill Climbing', hill_climbing),
-            ('Genetic Algorithm', genetic_algorithm),
-            ('Simulated Annealing', simulated_annealing)
-        ]
-
-        num_cities = [8, 16, 20]
-        num_iterations = 5000
-
-        for num_city in num_cities:
-            print(f"\nComparison for {num_city} cities:")
-            selected_cities = cities[:num_city]
-
-            for name, algorithm in algorithms:
-                start_time = time.time()
-                
-                current_cost, _, current_route = get_initial_path(cities_graph, selected_cities)  # Reset current_route and current_cost for each algorithm
-                if algorithm == hill_climbing:
-                    best_route, best_cost = hill_climbing(current_route, current_cost, num_iterations, cities_graph, selected_cities)
-                elif algorithm == genetic_algorithm:
-                    best_path = None
-                    best_cost = float('inf')
-                    population = genetic_algorithm(cities_graph, selected_cities, population_size=20, generations=1000)
-
-                    for path in population:
-                        cost = tsp_fitness(path, cities_graph)
-                        if cost < best_cost:
-                            best_cost = cost
-                            best_path = path
-                    best_route = best_path
-                elif algorithm == simulated_annealing:
-                    start_temp = 100
-                    end_temp = 0.1
-                    cooling_rate = 0.99
-                    current_cost, _, current_route = get_initial_path(cities_graph, selected_cities)  # Reset current_route and current_cost for simulated annealing
-                    best_route, best_cost = simulated_annealing(current_route, current_cost, start_temp, end_temp, cooling_rate, num_iterations, cities_graph)
-
-                end_time = time.time()
-                execution_time = end_time - start_time
-
-                print(f"{name}:")
-                print("Best route found:", best_route)
-                print("Cost of best route:", best_cost)
-                print("Execution time:", execution_time, "seconds")
+    if args.compare:
+        with open(args.compare) as file:
+            results = json.load(file)
+    else:
+        kinds = ['file:' + args.file] if args.file else args.kinds
+        sizes = [0] if args.file else args.sizes
+        runs = run_suite(args.solvers, kinds, sizes, args.repeats, args.seed, args.dense_limit, args.bound_limit)
+        results = {"runs": runs, "summary": summarise(runs)}
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        if args.csv:
+            write_csv(args.csv, runs)
+            write_csv(args.csv.rsplit('.', 1)[0] + '_summary.csv', results["summary"])
 
+    for row in results["summary"]:
+        line = f"{row['solver']:>8} {row['kind']:>9} {row['size']:>7}: cost {row['cost_median']:.2f} (p95 {row['cost_p95']:.2f}), wall {row['wall_seconds_median']:.3f}s (p95 {row['wall_seconds_p95']:.3f}s)"
+        if "evaluations_per_second_median" in row:
+            line += f", {row['evaluations_per_second_median']:.0f} evaluations/s"
+        if "gap_median" in row:
+            line += f", gap {100 * row['gap_median']:.2f}%"
+        print(line)
 
-    else:
-        print("Please specify the path to the cities file using --file option.")
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        changes = compare(results["summary"], baseline["summary"], args.tolerance, args.cost_tolerance)
+        for message, _ in changes:
+            print(message)
+        if any(worse for _, worse in changes):
+            sys.exit(1)
+        print("No regressions against the baseline.")
 
 if __name__ == "__main__":
     main()
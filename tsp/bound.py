@@ -0,0 +1,78 @@
+import numpy as np
+
+def one_tree(dist, pi):
+    '''
+        Minimum 1-tree under the penalised distances d(i, j) + pi[i] + pi[j]: a spanning tree of cities 1..n-1
+        built with a dense Prim pass, plus the two cheapest edges of city 0. Returns its length and every city's degree.
+    '''
+    n = len(pi)
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[:2] = True
+    degree = np.zeros(n, dtype=np.int64)
+    best = dist[1] + pi + pi[1]
+    parent = np.ones(n, dtype=np.intp)
+    total = 0.0
+    for _ in range(n - 2):
+        city = int(np.argmin(np.where(in_tree, np.inf, best)))
+        total += best[city]
+        in_tree[city] = True
+        degree[city] += 1
+        degree[parent[city]] += 1
+        row = dist[city] + pi + pi[city]
+        closer = row < best
+        best = np.where(closer, row, best)
+        parent = np.where(closer, city, parent)
+    row = dist[0] + pi + pi[0]
+    row[0] = np.inf
+    cheapest = np.argpartition(row, 1)[:2]
+    total += row[cheapest].sum()
+    degree[cheapest] += 1
+    degree[0] = 2
+    return total, degree
+
+def held_karp_bound(dist, upper_bound, iterations=100, patience=5):
+    '''
+        Held-Karp lower bound on the closed tour length by subgradient optimisation of the 1-tree penalties.
+        Cities of degree above two are made dearer and leaves cheaper, with a step size scaled by the distance
+        to upper_bound (the cost of any known tour) that halves whenever the bound stalls for patience iterations.
+        Overshooting steps, which a loose upper_bound makes early on, are taken back: each halving restarts from the best penalties.
+        Stops early when the 1-tree is itself a tour. dist is a dense matrix or anything answering dist.shape and rows dist[i].
+    '''
+    n = dist.shape[0]
+    if n < 3:
+        return float(upper_bound)
+    pi = np.zeros(n)
+    best_pi = pi
+    bound = -np.inf
+    scale = 2.0
+    stalled = 0
+    for _ in range(iterations):
+        total, degree = one_tree(dist, pi)
+        value = total - 2 * pi.sum()
+        if value > bound + 1e-9:
+            bound, stalled, best_pi = value, 0, pi.copy()
+        else:
+            stalled += 1
+            if stalled >= patience:
+                #overshooting steps, as a loose upper_bound makes them, are taken back along with the smaller step
+                scale, stalled, pi = scale / 2, 0, best_pi.copy()
+                continue
+        gradient = degree - 2
+        norm = float(gradient @ gradient)
+        if norm == 0 or scale < 1e-6:
+            break
+        pi += scale * max(upper_bound - value, 1e-9) / norm * gradient
+    return float(min(bound, upper_bound))
+
+def gap_target(graph, target_gap, upper_bound=None):
+    '''
+        Tour cost at which a solver is within target_gap (a fraction, 0.01 for 1%) of the Held-Karp bound, or None without a target.
+        upper_bound is the cost of a known closed tour; a nearest neighbour tour is built as well and the cheaper
+        of the two scales the subgradient steps, since a random initial tour is far too loose for them.
+    '''
+    if target_gap is None:
+        return None
+    from construct import nearest_neighbour_tour
+    nearest = graph.idTourCost(nearest_neighbour_tour(graph))
+    upper_bound = nearest if upper_bound is None else min(upper_bound, nearest)
+    return held_karp_bound(graph.dist, upper_bound) * (1 + target_gap)
@@ -0,0 +1,237 @@
+import numpy as np
+from spatial import GridIndex, candidate_lists, planar_coordinates
+
+def nearest_neighbour_tour(graph, candidates=None, start=0):
+    '''
+        Nearest neighbour tour from start. The next city is looked up in the current city's candidate list first,
+        and only when all candidates are visited does it fall back to the nearest unvisited city over a GridIndex
+        of the unvisited cities, rebuilt whenever half of its cities have been visited since it was made,
+        or to a scan of the distance matrix row for a graph without coordinates.
+    '''
+    if candidates is None:
+        candidates = candidate_lists(graph)
+    dist = graph.dist
+    n = graph.numOfNodes()
+    xy = planar_coordinates(graph)
+    visited = np.zeros(n, dtype=bool)
+    tour = np.empty(n, dtype=np.intp)
+    index = None
+    current = start
+    for k in range(n):
+        tour[k] = current
+        visited[current] = True
+        if index is not None and slot[current] >= 0:
+            alive[slot[current]] = False
+        if k == n - 1:
+            break
+        options = candidates[current][~visited[candidates[current]]]
+        if len(options):
+            current = int(options[0])
+        elif xy is not None:
+            if index is None or 2 * (n - k - 1) < len(ids):
+                ids = np.flatnonzero(~visited)
+                index = GridIndex(xy[0][ids], xy[1][ids])
+                alive = np.ones(len(ids), dtype=bool)
+                slot = np.full(n, -1, dtype=np.intp)
+                slot[ids] = np.arange(len(ids))
+            current = int(ids[index.nearest(xy[0][current], xy[1][current], alive)])
+        else:
+            row = np.where(visited, np.inf, dist[current])
+            current = int(np.argmin(row))
+    return tour
+
+class _DisjointSet:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return False
+        self.parent[x] = y
+        return True
+
+def _candidate_edges(graph, candidates, ids=None):
+    '''Candidate edges (i, j) with i < j, sorted by length; row r of candidates belongs to ids[r], or to city r without ids'''
+    n, k = candidates.shape
+    first = np.repeat(np.arange(n) if ids is None else ids, k)
+    second = candidates.ravel()
+    edges = np.unique(np.stack((np.minimum(first, second), np.maximum(first, second)), axis=1), axis=0)
+    lengths = graph.dist[edges[:, 0], edges[:, 1]]
+    return edges[np.argsort(lengths, kind='stable')]
+
+def _fragments_to_tour(graph, adjacency):
+    '''Joins the path fragments of a degree <= 2 edge set into one tour, always linking to the nearest free endpoint'''
+    n = graph.numOfNodes()
+    dist = graph.dist
+    degree = np.array([len(a) for a in adjacency])
+    visited = np.zeros(n, dtype=bool)
+    tour = []
+    current = int(np.flatnonzero(degree < 2)[0]) if (degree < 2).any() else 0
+    while len(tour) < n:
+        #walk the fragment starting at current
+        previous = -1
+        while True:
+            tour.append(current)
+            visited[current] = True
+            following = [city for city in adjacency[current] if city != previous and not visited[city]]
+            if not following:
+                break
+            previous, current = current, following[0]
+        if len(tour) == n:
+            break
+        endpoints = np.flatnonzero(~visited & (degree < 2))
+        current = int(endpoints[np.argmin(dist[current, endpoints])])
+    return np.array(tour, dtype=np.intp)
+
+def greedy_edge_tour(graph, candidates=None):
+    '''
+        Greedy edge matching: candidate edges are taken shortest first whenever both ends still have degree below two
+        and the edge doesn't close a cycle. The resulting fragments are then chained by nearest endpoint.
+    '''
+    if candidates is None:
+        candidates = candidate_lists(graph)
+    n = graph.numOfNodes()
+    adjacency = [[] for _ in range(n)]
+    components = _DisjointSet(n)
+    for i, j in _candidate_edges(graph, candidates).tolist():
+        if len(adjacency[i]) < 2 and len(adjacency[j]) < 2 and components.union(i, j):
+            adjacency[i].append(j)
+            adjacency[j].append(i)
+    return _fragments_to_tour(graph, adjacency)
+
+def _minimum_spanning_tree(graph, candidates):
+    '''Kruskal over the candidate edges, with a dense Prim pass when the candidate graph is disconnected'''
+    n = graph.numOfNodes()
+    adjacency = [[] for _ in range(n)]
+    components = _DisjointSet(n)
+    added = 0
+    for i, j in _candidate_edges(graph, candidates).tolist():
+        if components.union(i, j):
+            adjacency[i].append(j)
+            adjacency[j].append(i)
+            added += 1
+    if added == n - 1:
+        return adjacency
+    adjacency = [[] for _ in range(n)]
+    dist = graph.dist
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[0] = True
+    best = np.array(dist[0], dtype=np.float64)
+    parent = np.zeros(n, dtype=np.intp)
+    for _ in range(n - 1):
+        city = int(np.argmin(np.where(in_tree, np.inf, best)))
+        in_tree[city] = True
+        adjacency[city].append(int(parent[city]))
+        adjacency[int(parent[city])].append(city)
+        closer = dist[city] < best
+        best = np.where(closer, dist[city], best)
+        parent = np.where(closer, city, parent)
+    return adjacency
+
+def _greedy_matching(graph, odd, candidates):
+    '''
+        Greedy perfect matching of the cities odd, shortest edge first, over the candidate edges between two of them.
+        The cities left unmatched get candidate lists among themselves and are matched the same way, round after round;
+        each round matches at least the closest pair left, and the last few cities are matched over all their pairs.
+        Returns the matched pairs.
+    '''
+    pairs = []
+    is_odd = np.zeros(graph.numOfNodes(), dtype=bool)
+    is_odd[odd] = True
+    edges = _candidate_edges(graph, candidates)
+    edges = edges[is_odd[edges[:, 0]] & is_odd[edges[:, 1]]]
+    left = odd
+    while len(left):
+        matched = set()
+        for a, b in edges.tolist():
+            if a not in matched and b not in matched:
+                matched.update((a, b))
+                pairs.append((a, b))
+        left = np.array([city for city in left.tolist() if city not in matched], dtype=np.intp)
+        if len(left) <= 64:
+            #few enough to pair over every edge between them
+            edges = np.array([(a, b) for i, a in enumerate(left.tolist()) for b in left[i + 1:].tolist()], dtype=np.intp).reshape(-1, 2)
+            edges = edges[np.argsort(graph.dist[edges[:, 0], edges[:, 1]], kind='stable')] if len(edges) else edges
+        else:
+            edges = _candidate_edges(graph, candidate_lists(graph, ids=left), left)
+    return pairs
+
+def christofides_lite_tour(graph, candidates=None):
+    '''
+        Christofides with the minimum weight perfect matching replaced by a greedy one:
+        spanning tree, greedy matching of the odd degree cities over candidate edges (see _greedy_matching),
+        Euler circuit, then shortcutting repeated cities.
+    '''
+    if candidates is None:
+        candidates = candidate_lists(graph)
+    adjacency = _minimum_spanning_tree(graph, candidates)
+    odd = np.array([city for city in range(len(adjacency)) if len(adjacency[city]) % 2], dtype=np.intp)
+    for a, b in _greedy_matching(graph, odd, candidates):
+        adjacency[a].append(b)
+        adjacency[b].append(a)
+    #Hierholzer's algorithm on the multigraph, shortcutting cities that were already visited
+    remaining = [list(neighbours) for neighbours in adjacency]
+    stack = [0]
+    circuit = []
+    while stack:
+        city = stack[-1]
+        if remaining[city]:
+            other = remaining[city].pop()
+            remaining[other].remove(city)
+            stack.append(other)
+        else:
+            circuit.append(stack.pop())
+    return np.array(list(dict.fromkeys(circuit)), dtype=np.intp)
+
+def _hilbert_index(x, y, order):
+    '''Position of integer grid points (x, y) along a Hilbert curve covering a 2**order square'''
+    x, y = x.copy(), y.copy()
+    index = np.zeros(len(x), dtype=np.int64)
+    side = 1 << order
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        index += s * s * ((3 * rx) ^ ry)
+        #rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return index
+
+def space_filling_curve_tour(graph, order=16):
+    '''Visits the cities in the order of a Hilbert curve over their projected coordinates, in O(n log n)'''
+    xy = planar_coordinates(graph)
+    if xy is None:
+        return nearest_neighbour_tour(graph)
+    x, y = xy
+    scale = max(np.ptp(x), np.ptp(y), 1e-9)
+    cells = (1 << order) - 1
+    gx = ((x - x.min()) / scale * cells).astype(np.int64)
+    gy = ((y - y.min()) / scale * cells).astype(np.int64)
+    return np.argsort(_hilbert_index(gx, gy, order), kind='stable')
+
+CONSTRUCTIONS = {
+    'nearest': nearest_neighbour_tour,
+    'greedy': greedy_edge_tour,
+    'christofides': christofides_lite_tour,
+    'hilbert': space_filling_curve_tour,
+}
+
+def construct_path(graph, method='greedy'):
+    '''Builds an initial closed route with one of CONSTRUCTIONS, in the (cost, all_visited, path) shape of get_initial_path'''
+    tour = CONSTRUCTIONS[method](graph)
+    path = graph.toNames(tour)
+    path.append(path[0])
+    return graph.pathCost(path), len(path) - 1, path
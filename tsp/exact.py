@@ -0,0 +1,56 @@
+import numpy as np
+
+MAX_CITIES = 24
+
+def held_karp(dist):
+    '''
+        Exact shortest closed tour by Held-Karp dynamic programming over bitmask subsets of the cities other than 0.
+        cost[mask, j] is the shortest path from city 0 through the subset mask ending at city j + 1; subsets are processed
+        one popcount layer at a time so every layer is a handful of vectorised gathers and argmins.
+        Predecessors are kept in an int32 table for the reconstruction. Returns the tour as ids starting at 0 and its cost.
+    '''
+    dist = np.asarray(dist, dtype=np.float64)
+    n = len(dist)
+    if n > MAX_CITIES:
+        raise ValueError(f"Held-Karp needs O(2^n n) memory, refusing {n} cities (at most {MAX_CITIES})")
+    if n <= 3:
+        tour = np.arange(n)
+        return tour, float(dist[tour, np.roll(tour, -1)].sum()) if n > 1 else 0.0
+    m = n - 1
+    size = 1 << m
+    bits = 1 << np.arange(m)
+    inner = dist[1:, 1:]
+    cost = np.full((size, m), np.inf)
+    parent = np.full((size, m), -1, dtype=np.int32)
+    cost[bits, np.arange(m)] = dist[0, 1:]
+    masks = np.arange(size)
+    popcount = np.zeros(size, dtype=np.int8)
+    for bit in bits:
+        popcount += (masks & bit) > 0
+    order = np.argsort(popcount, kind='stable')
+    layers = np.split(masks[order], np.cumsum(np.bincount(popcount, minlength=m + 1))[:-1])
+    for layer in layers[2:]:
+        for j in range(m):
+            subset = layer[(layer & bits[j]) != 0]
+            #cost of a predecessor outside subset is still inf, so the argmin only picks cities inside it
+            totals = cost[subset ^ bits[j]] + inner[:, j]
+            best = np.argmin(totals, axis=1)
+            cost[subset, j] = totals[np.arange(len(subset)), best]
+            parent[subset, j] = best
+    full = size - 1
+    closing = cost[full] + dist[1:, 0]
+    last = int(np.argmin(closing))
+    tour = []
+    mask, j = full, last
+    while j >= 0:
+        tour.append(j + 1)
+        mask, j = mask ^ int(bits[j]), int(parent[mask, j])
+    tour.append(0)
+    return np.array(tour[::-1], dtype=np.intp), float(closing[last])
+
+def exact_tour(graph, cities=None):
+    '''Optimal closed route over cities (all of the graph by default) as names, and its cost'''
+    ids = graph.toIds(cities) if cities is not None else np.arange(graph.numOfNodes())
+    tour, cost = held_karp(graph.dist[np.ix_(ids, ids)])
+    route = graph.toNames(ids[tour])
+    return route + route[:1], cost
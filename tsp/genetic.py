@@ -1,75 +1,51 @@
 import argparse
 import random
-from graph import Graph
-
-def read_cities_from_file(filename):
-    cities = {}
-    try:
-        with open(filename, 'r') as file:
-            for line in file:
-                parts = line.strip().split()
-                if len(parts) == 3:
-                    name = parts[0]
-                    latitude = float(parts[1])
-                    longitude = float(parts[2])
-                    cities[name] = (latitude, longitude)
-                else:
-                    print(f"Ignoring improperly formatted line: {line}")
-    except FileNotFoundError:
-        print(f"File '{filename}' not found.")
-    except Exception as e:
-        print(f"Error reading file '{filename}': {str(e)}")
-    return cities
-
-def add_edges_from_file(graph, filename):
-    cities = read_cities_from_file(filename)
-    for city1 in cities:
-        for city2 in cities:
-            if city1 != city2:
-                lat1, lon1 = cities[city1]
-                lat2, lon2 = cities[city2]
-                # Calculating distance using Haversine formula
-                distance = haversine(lon1, lat1, lon2, lat2)
-                graph.addEdge(city1, city2, distance)
-
-def haversine(lon1, lat1, lon2, lat2):
-    from math import radians, sin, cos, sqrt, atan2
-
-    # Convert decimal degrees to radians
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    radius_of_earth = 6371  # in kilometers
-    distance = radius_of_earth * c
-    return distance
+import numpy as np
+from loader import read_cities_from_file, add_edges_from_file, load_graph
+from moves import MoveEngine
+from spatial import candidate_lists
+from bound import gap_target
 
 def tsp_fitness(path, graph):
-    distance = 0
-    for i in range(len(path) - 1):
-        current_node = path[i]
-        next_node = path[i + 1]
-        neighbors = graph.getNeighbours(current_node)
-        found = False
-        for neighbor, cost in neighbors:
-            if neighbor == next_node:
-                distance += cost
-                found = True
-                break
-        if not found:
-            raise ValueError(f"No edge found between {current_node} and {next_node}")
-    return distance
+    return graph.pathCost(path)
 
 def generate_random_path(cities):
     return random.sample(cities, len(cities))
 
-def genetic_algorithm(graph, cities, population_size=10, generations=100):
+def genetic_algorithm(graph, cities, population_size=10, generations=100, target_gap=None, instrument=None, stopping=None):
+    if instrument is not None:
+        instrument.enter('init')
     population = [generate_random_path(cities) for _ in range(population_size)]
-    for _ in range(generations):
+    target = gap_target(graph, target_gap)
+    if instrument is not None:
+        instrument.leave()
+    best_cost = float('inf')
+    reason = 'generations'
+    for generation in range(generations):
+        if instrument is not None:
+            instrument.enter('neighbours')
         population = evolve_population(population, graph)
+        if target is None and instrument is None and stopping is None:
+            continue
+        #this variant scores nothing while evolving, so a generation is only scored when something watches it;
+        #the bound is on closed tours, so the open paths are scored with their closing edge here
+        if instrument is not None:
+            instrument.switch('scoring')
+        cost = min(graph.pathCost(path + path[:1]) for path in population)
+        best_cost = min(best_cost, cost)
+        if instrument is not None:
+            instrument.leave()
+            instrument.evaluations += len(population)
+            instrument.proposed += len(population)
+            instrument.accepted += len(population)
+            instrument.iteration(generation, cost, best_cost)
+        if target is not None and cost <= target:
+            reason = 'target'
+            break
+        if stopping is not None and stopping.check(best_cost, (generation + 1) * len(population)):
+            break
+    if stopping is not None:
+        stopping.finish(reason)
     return population
 
 def evolve_population(population, graph, mutation_rate=0.1):
@@ -86,8 +62,9 @@ def evolve_population(population, graph, mutation_rate=0.1):
 def reproduce(parent1, parent2):
     crossover_point = random.randint(0, len(parent1) - 1)
     child = parent1[:crossover_point]
+    in_child = set(child)
     for city in parent2:
-        if city not in child:
+        if city not in in_child:
             child.append(city)
     return child
 
@@ -97,6 +74,250 @@ def mutate(path, graph):
     path[mutation_point1], path[mutation_point2] = path[mutation_point2], path[mutation_point1]
     return path
 
+def population_costs(population, dist, closed=False):
+    '''Path cost of every row of a (population, cities) array of city ids, in one fancy-indexed sum'''
+    if closed:
+        return dist[population, np.roll(population, -1, axis=1)].sum(axis=1, dtype=np.float64)
+    return dist[population[:, :-1], population[:, 1:]].sum(axis=1, dtype=np.float64)
+
+def random_population(population_size, num_cities, rng):
+    return np.argsort(rng.random((population_size, num_cities)), axis=1)
+
+def order_crossover(parents1, parents2, rng):
+    '''
+        Order crossover (OX) of every pair of rows at once.
+        Each child keeps a random slice of its first parent in place and fills the other positions, starting after the slice,
+        with the remaining cities in the order they appear in the second parent read from the same point.
+        Membership is a boolean bitmap per child, so the whole batch runs in O(population * cities).
+    '''
+    size, n = parents1.shape
+    rows = np.arange(size)[:, None]
+    columns = np.arange(n)[None, :]
+    cuts = np.sort(rng.integers(0, n + 1, size=(size, 2)), axis=1)
+    start, stop = cuts[:, :1], cuts[:, 1:]
+    in_slice = (columns >= start) & (columns < stop)
+    used = np.zeros((size, n), dtype=bool)
+    used[rows, parents1] = in_slice
+    rotated = np.take_along_axis(parents2, (columns + stop) % n, axis=1)
+    keep = ~np.take_along_axis(used, rotated, axis=1)
+    rank = np.cumsum(keep, axis=1) - 1
+    children = np.where(in_slice, parents1, 0)
+    target_rows, target_columns = np.nonzero(keep)
+    children[target_rows, (stop[target_rows, 0] + rank[keep]) % n] = rotated[keep]
+    return children
+
+def pmx_crossover(parent1, parent2, rng):
+    '''
+        Partially mapped crossover (PMX) of two id arrays.
+        The child takes a slice from parent1 and the rest from parent2; cities of parent2 that clash with the slice
+        are replaced by following the slice's parent1 -> parent2 mapping, found in O(1) through a position array.
+    '''
+    n = len(parent1)
+    start, stop = np.sort(rng.integers(0, n + 1, size=2))
+    child = parent2.copy()
+    child[start:stop] = parent1[start:stop]
+    in_slice = np.zeros(n, dtype=bool)
+    in_slice[parent1[start:stop]] = True
+    position_in_parent1 = np.empty(n, dtype=np.intp)
+    position_in_parent1[parent1] = np.arange(n)
+    outside = np.r_[0:start, stop:n]
+    for i in outside[in_slice[parent2[outside]]]:
+        city = parent2[i]
+        while in_slice[city]:
+            city = parent2[position_in_parent1[city]]
+        child[i] = city
+    return child
+
+def swap_mutation(population, mutation_rate, rng):
+    '''Swaps two random positions in each row with probability mutation_rate, in place'''
+    size, n = population.shape
+    rows = np.flatnonzero(rng.random(size) < mutation_rate)
+    first = rng.integers(0, n, size=len(rows))
+    second = rng.integers(0, n, size=len(rows))
+    population[rows, first], population[rows, second] = population[rows, second], population[rows, first]
+    return population
+
+def evolve_population_array(population, dist, rng, mutation_rate=0.1, crossover='ox'):
+    '''evolve_population over a 2-D id array: uniformly chosen parent pairs, OX or PMX crossover and swap mutation'''
+    size = len(population)
+    parents1 = population[rng.integers(0, size, size=size)]
+    parents2 = population[rng.integers(0, size, size=size)]
+    if crossover == 'pmx':
+        children = np.array([pmx_crossover(a, b, rng) for a, b in zip(parents1, parents2)])
+    else:
+        children = order_crossover(parents1, parents2, rng)
+    return swap_mutation(children, mutation_rate, rng)
+
+def genetic_algorithm_array(graph, population_size=10, generations=100, mutation_rate=0.1, crossover='ox', seed=None, target_gap=None, stats=None, instrument=None, stopping=None):
+    '''
+        genetic_algorithm with the population held as a (population_size, cities) array of ids,
+        scored every generation so the best individual ever seen is kept.
+        With target_gap it stops once some closed tour of the population is within that gap of the Held-Karp bound,
+        and it also ends when the stopping criteria, checked every generation on the best path cost, say so.
+        The scored individuals and generations are counted into stats when given, and every generation is recorded by instrument.
+        Returns the best path as names, its cost and the final population.
+    '''
+    if instrument is not None:
+        instrument.enter('init')
+    rng = np.random.default_rng(seed)
+    dist = graph.dist
+    population = random_population(population_size, graph.numOfNodes(), rng)
+    target = gap_target(graph, target_gap)
+    best_path, best_cost = None, float('inf')
+    generation = 0
+    reason = 'generations'
+    if instrument is not None:
+        instrument.leave()
+    for generation in range(1, generations + 1):
+        if instrument is not None:
+            instrument.enter('neighbours')
+        population = evolve_population_array(population, dist, rng, mutation_rate, crossover)
+        if instrument is not None:
+            instrument.switch('scoring')
+        costs = population_costs(population, dist)
+        fittest = int(np.argmin(costs))
+        if costs[fittest] < best_cost:
+            best_path, best_cost = population[fittest].copy(), float(costs[fittest])
+        if instrument is not None:
+            instrument.leave()
+            instrument.evaluations += population_size
+            instrument.proposed += population_size
+            instrument.accepted += population_size
+            instrument.iteration(generation, float(costs[fittest]), best_cost)
+        if target is not None and population_costs(population, dist, closed=True).min() <= target:
+            reason = 'target'
+            break
+        if stopping is not None and stopping.check(best_cost, generation * population_size):
+            break
+    if stopping is not None:
+        stopping.finish(reason)
+    if stats is not None:
+        stats.update(evaluations=generation * population_size, generations=generation)
+    return graph.toNames(best_path), best_cost, population
+
+def tournament_selection(costs, count, rng, tournament_size=3):
+    '''Indices of count winners, each the cheapest of tournament_size individuals drawn at random'''
+    entrants = rng.integers(0, len(costs), size=(count, tournament_size))
+    return entrants[np.arange(count), np.argmin(costs[entrants], axis=1)]
+
+def edge_recombination(parent1, parent2, rng):
+    '''
+        Edge recombination crossover (ERX) of two closed tours given as id arrays.
+        The child is walked from parent1's first city, always moving to the unvisited neighbour (in either parent)
+        that has the fewest unvisited neighbours left, so nearly all of its edges come from a parent.
+    '''
+    n = len(parent1)
+    neighbours = [set() for _ in range(n)]
+    for parent in (parent1.tolist(), parent2.tolist()):
+        for i, city in enumerate(parent):
+            neighbours[city].add(parent[i - 1])
+            neighbours[city].add(parent[(i + 1) % n])
+    #unvisited cities in a list with an index map, so a random one can be drawn and removed in O(1)
+    unvisited = list(range(n))
+    where = list(range(n))
+    def visit(city):
+        i, last = where[city], unvisited[-1]
+        unvisited[i], where[last] = last, i
+        unvisited.pop()
+        for other in neighbours[city]:
+            neighbours[other].discard(city)
+    child = np.empty(n, dtype=np.intp)
+    current = int(parent1[0])
+    for k in range(n):
+        child[k] = current
+        visit(current)
+        if not unvisited:
+            break
+        options = neighbours[current]
+        if options:
+            fewest = min(len(neighbours[city]) for city in options)
+            current = rng.choice([city for city in options if len(neighbours[city]) == fewest])
+        else:
+            current = unvisited[rng.integers(len(unvisited))]
+    return child
+
+def two_opt_repair(tour, dist, candidates, max_passes=1):
+    '''Bounded first-improvement 2-opt over candidate lists: at most max_passes sweeps over the cities'''
+    engine = MoveEngine(dist, tour)
+    n, pos = engine.n, engine.pos
+    for _ in range(max_passes):
+        improved = False
+        for city in engine.tour.tolist():
+            for other in candidates[city]:
+                i, j = sorted((int(pos[city]), int(pos[other])))
+                if j - i < 2 or j - i > n - 2:
+                    continue
+                #this reversal makes city and other adjacent
+                delta = engine.two_opt_delta(i, j)
+                if delta < -1e-9:
+                    engine.apply(('2opt', i, j), delta)
+                    improved = True
+                    break
+        if not improved:
+            break
+    return engine.tour
+
+def memetic_algorithm(graph, population_size=50, generations=100, mutation_rate=0.1, tournament_size=3, repair_passes=1, candidates=None, seed=None, target_gap=None, instrument=None, stopping=None):
+    '''
+        Memetic variant of genetic_algorithm_array over closed tours.
+        Parents are picked by tournament on their costs, children are built with edge recombination,
+        mutated with a swap and immediately improved by a bounded candidate-list 2-opt pass.
+        The best individual always survives into the next generation, and the run stops early
+        once it is within target_gap of the Held-Karp bound or when the stopping criteria end it.
+        Every generation is recorded by instrument when given; the 2-opt repair is timed with the children it improves.
+        Returns the best closed route as names, its cost and the final population.
+    '''
+    if instrument is not None:
+        instrument.enter('init')
+    rng = np.random.default_rng(seed)
+    dist = graph.dist
+    if candidates is None:
+        candidates = candidate_lists(graph)
+    candidates = candidates.tolist()
+    population = random_population(population_size, graph.numOfNodes(), rng)
+    population = np.array([two_opt_repair(tour, dist, candidates, repair_passes) for tour in population])
+    costs = population_costs(population, dist, closed=True)
+    target = gap_target(graph, target_gap, costs.min())
+    if instrument is not None:
+        instrument.leave()
+        instrument.evaluations += population_size
+    reason = 'generations'
+    for generation in range(generations):
+        if target is not None and costs.min() <= target:
+            reason = 'target'
+            break
+        if instrument is not None:
+            instrument.enter('selection')
+        parents = tournament_selection(costs, 2 * population_size, rng, tournament_size)
+        if instrument is not None:
+            instrument.switch('neighbours')
+        children = np.array([edge_recombination(population[a], population[b], rng) for a, b in parents.reshape(-1, 2)])
+        children = swap_mutation(children, mutation_rate, rng)
+        children = np.array([two_opt_repair(tour, dist, candidates, repair_passes) for tour in children])
+        if instrument is not None:
+            instrument.switch('scoring')
+        child_costs = population_costs(children, dist, closed=True)
+        if instrument is not None:
+            instrument.switch('selection')
+        elite = int(np.argmin(costs))
+        worst = int(np.argmax(child_costs))
+        if costs[elite] < child_costs[worst]:
+            children[worst], child_costs[worst] = population[elite], costs[elite]
+        population, costs = children, child_costs
+        if instrument is not None:
+            instrument.leave()
+            instrument.evaluations += population_size
+            instrument.proposed += population_size
+            instrument.accepted += population_size
+            instrument.iteration(generation, float(costs.min()), float(costs.min()), mean=float(costs.mean()))
+        if stopping is not None and stopping.check(float(costs.min()), (generation + 2) * population_size):
+            break
+    if stopping is not None:
+        stopping.finish(reason)
+    best = int(np.argmin(costs))
+    route = graph.toNames(population[best])
+    return route + route[:1], float(costs[best]), population
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Traveling Salesman Problem Solver')
     parser.add_argument('--file', help='Path to the cities file')
@@ -104,8 +325,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     if args.file:
-        cities_graph = Graph()
-        add_edges_from_file(cities_graph, args.file)
+        cities_graph = load_graph(args.file)
 
         cities = list(cities_graph.map.keys())
 
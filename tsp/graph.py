@@ -1,3 +1,9 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+
+
 class Graph:
     def __init__(self):
         self.map = dict()
@@ -58,4 +64,253 @@ class Graph:
   
     def search(self ,node : any) -> bool:
         return node in self.map
-    
+
+    def edgeCost(self , startNode : any , destinationNode : any) -> float:
+        for neighbour , cost in self.getNeighbours(startNode):
+            if neighbour == destinationNode:
+                return cost
+        raise ValueError(f"No edge between {startNode} and {destinationNode}")
+
+    def pathCost(self , path : list) -> float:
+        '''Returns the total cost of walking the path in order'''
+        distance = 0
+        for i in range(len(path) - 1):
+            distance += self.edgeCost(path[i] , path[i + 1])
+        return distance
+
+    def toMatrix(self , dtype = np.float64):
+        '''Returns a MatrixGraph holding the same nodes and edges'''
+        newGraph = MatrixGraph(dtype=dtype , capacity=max(len(self.map) , 1))
+        for node in self.map:
+            newGraph.createNode(node)
+        for node , neighbours in self.map.items():
+            for neighbour , cost in neighbours:
+                newGraph.addEdge(node , neighbour , cost , directed=True)
+        return newGraph
+
+
+class NeighbourView(Mapping):
+    '''Read-only dict-of-sets view over a MatrixGraph, so code written against Graph.map keeps working'''
+    def __init__(self , graph):
+        self.graph = graph
+
+    def __getitem__(self , node : any) -> set:
+        return self.graph.getNeighbours(node)
+
+    def __iter__(self):
+        return iter(self.graph.names)
+
+    def __len__(self) -> int:
+        return len(self.graph.names)
+
+    def __contains__(self , node : any) -> bool:
+        return node in self.graph.index
+
+
+class MatrixGraph:
+    '''
+        Graph backed by a dense distance matrix.
+        Nodes are mapped to contiguous integer ids in insertion order and edge costs live in a NumPy array,
+        so looking up an edge is O(1) and the cost of a whole tour is a single fancy-indexed sum.
+        Missing edges are stored as infinity.
+    '''
+    def __init__(self , dtype = np.float64 , capacity : int = 16):
+        self.names = []
+        self.index = dict()
+        self.__dist = np.full((capacity , capacity) , np.inf , dtype=dtype)
+        np.fill_diagonal(self.__dist , 0)
+        self.map = NeighbourView(self)
+
+    coordinates = None
+    planar = None
+
+    @classmethod
+    def fromMatrix(cls , names : list , dist : np.ndarray , coordinates : np.ndarray = None , planar : np.ndarray = None):
+        '''
+            Wraps an already computed n x n distance matrix, names[i] being the node with id i.
+            coordinates optionally holds the (latitude , longitude) of every node and planar their (x , y)
+            for instances that live on a plane, both used for spatial indexing.
+        '''
+        if dist.shape != (len(names) , len(names)):
+            raise ValueError("Distance matrix doesn't match the number of nodes!")
+        graph = cls.__new__(cls)
+        graph.names = list(names)
+        graph.index = {name : i for i , name in enumerate(graph.names)}
+        graph.__dist = dist
+        graph.map = NeighbourView(graph)
+        graph.coordinates = coordinates
+        graph.planar = planar
+        return graph
+
+    @property
+    def dist(self) -> np.ndarray:
+        '''n x n view of the distance matrix'''
+        n = len(self.names)
+        return self.__dist[:n , :n]
+
+    def numOfNodes(self) -> int:
+        return len(self.names)
+
+    def copy(self):
+        '''Returns a copy of the graph sharing the same distance matrix'''
+        return MatrixGraph.fromMatrix(self.names , self.dist , self.coordinates , self.planar)
+
+    def createNode(self , node : any) -> None:
+        if node in self.index:
+            return
+        n = len(self.names)
+        capacity = self.__dist.shape[0]
+        if n == capacity:
+            #grow geometrically so that adding n nodes one by one stays amortised O(n^2)
+            grown = np.full((2 * capacity , 2 * capacity) , np.inf , dtype=self.__dist.dtype)
+            np.fill_diagonal(grown , 0)
+            grown[:n , :n] = self.__dist
+            self.__dist = grown
+        self.index[node] = n
+        self.names.append(node)
+
+    def addEdge(self , startNode : any , destinationNode : any , cost : float = 1.0 , directed : bool = False) -> None:
+        self.createNode(startNode)
+        self.createNode(destinationNode)
+        i , j = self.index[startNode] , self.index[destinationNode]
+        self.__dist[i , j] = cost
+        if not directed:
+            self.__dist[j , i] = cost
+
+    def removeEdge(self , startNode : any , destinationNode : any , cost : float = 1.0) -> None:
+        if destinationNode not in self.index or startNode not in self.index:
+            raise Exception("Edge doesn't exist!")
+        i , j = self.index[startNode] , self.index[destinationNode]
+        self.__dist[i , j] = np.inf
+        if self.__dist[j , i] == cost:
+            self.__dist[j , i] = np.inf
+
+    def getNeighbours(self , node : any) -> set:
+        try:
+            i = self.index[node]
+        except KeyError:
+            raise Exception("Node doesn't exist!")
+        row = self.dist[i]
+        ids = np.flatnonzero(np.isfinite(row))
+        return {(self.names[j] , float(row[j])) for j in ids if j != i}
+
+    def search(self , node : any) -> bool:
+        return node in self.index
+
+    def toIds(self , path : list) -> np.ndarray:
+        return np.fromiter((self.index[node] for node in path) , dtype=np.intp , count=len(path))
+
+    def toNames(self , ids) -> list:
+        return [self.names[i] for i in ids]
+
+    def edgeCost(self , startNode : any , destinationNode : any) -> float:
+        cost = self.__dist[self.index[startNode] , self.index[destinationNode]]
+        if cost == np.inf:
+            raise ValueError(f"No edge between {startNode} and {destinationNode}")
+        return float(cost)
+
+    def idPathCost(self , ids) -> float:
+        '''Cost of an open path given as node ids, vectorised over the distance matrix'''
+        ids = np.asarray(ids)
+        return float(self.dist[ids[:-1] , ids[1:]].sum(dtype=np.float64))
+
+    def idTourCost(self , ids) -> float:
+        '''Cost of the closed tour visiting the ids in order and returning to the first one'''
+        ids = np.asarray(ids)
+        return float(self.dist[ids , np.roll(ids , -1)].sum(dtype=np.float64))
+
+    def pathCost(self , path : list) -> float:
+        '''Returns the total cost of walking the path in order'''
+        if len(path) < 2:
+            return 0
+        ids = self.toIds(path)
+        legs = self.dist[ids[:-1] , ids[1:]]
+        if not np.isfinite(legs).all():
+            k = int(np.flatnonzero(~np.isfinite(legs))[0])
+            raise ValueError(f"No edge between {path[k]} and {path[k + 1]}")
+        return float(legs.sum(dtype=np.float64))
+
+
+class LazyDistances:
+    '''
+        Stand-in for a distance matrix that computes entries on demand from coordinate arrays.
+        Single entries go through a bounded LRU cache keyed by the unordered pair of ids;
+        rows and fancy-indexed batches are computed in one vectorised call and not cached.
+        hits , misses and evictions count the cache traffic.
+    '''
+    def __init__(self , coordinates : np.ndarray , distance , capacity : int = 1 << 20 , dtype = np.float64):
+        self.lat = np.ascontiguousarray(coordinates[: , 0] , dtype=np.float64)
+        self.lon = np.ascontiguousarray(coordinates[: , 1] , dtype=np.float64)
+        self.distance = distance
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.shape = (len(self.lat) , len(self.lat))
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        return {"hits" : self.hits , "misses" : self.misses , "evictions" : self.evictions , "size" : len(self.cache) , "capacity" : self.capacity}
+
+    def __pair(self , i : int , j : int) -> float:
+        key = (i , j) if i < j else (j , i)
+        cost = self.cache.get(key)
+        if cost is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return cost
+        self.misses += 1
+        cost = 0.0 if i == j else float(self.distance(self.lat[i] , self.lon[i] , self.lat[j] , self.lon[j]))
+        self.cache[key] = cost
+        if len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return cost
+
+    def __getitem__(self , key):
+        if not isinstance(key , tuple):
+            #a whole row
+            i = int(key)
+            return self.distance(self.lat[i] , self.lon[i] , self.lat , self.lon).astype(self.dtype)
+        i , j = key
+        if np.ndim(i) == 0 and np.ndim(j) == 0:
+            return self.__pair(int(i) , int(j))
+        i , j = np.broadcast_arrays(np.asarray(i) , np.asarray(j))
+        return self.distance(self.lat[i] , self.lon[i] , self.lat[j] , self.lon[j]).astype(self.dtype)
+
+
+class LazyGraph(MatrixGraph):
+    '''
+        Read-only MatrixGraph whose distances are computed on demand, for instances too large for an n x n matrix.
+        Code written against MatrixGraph.dist keeps working since LazyDistances answers the same indexing.
+    '''
+    def __init__(self , names : list , coordinates : np.ndarray , distance , capacity : int = 1 << 20 , dtype = np.float64):
+        self.names = list(names)
+        self.index = {name : i for i , name in enumerate(self.names)}
+        self.coordinates = coordinates
+        self.lazy = LazyDistances(coordinates , distance , capacity , dtype)
+        self.map = NeighbourView(self)
+
+    @property
+    def dist(self) -> LazyDistances:
+        return self.lazy
+
+    def copy(self):
+        '''Returns a copy of the graph sharing the same distance cache'''
+        newGraph = LazyGraph.__new__(LazyGraph)
+        newGraph.__dict__.update(self.__dict__)
+        newGraph.map = NeighbourView(newGraph)
+        return newGraph
+
+    def createNode(self , node : any) -> None:
+        raise Exception("LazyGraph is read-only!")
+
+    def addEdge(self , startNode : any , destinationNode : any , cost : float = 1.0 , directed : bool = False) -> None:
+        raise Exception("LazyGraph is read-only!")
+
+    def removeEdge(self , startNode : any , destinationNode : any , cost : float = 1.0) -> None:
+        raise Exception("LazyGraph is read-only!")
+
+    def edgeCost(self , startNode : any , destinationNode : any) -> float:
+        return self.lazy[self.index[startNode] , self.index[destinationNode]]
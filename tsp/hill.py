@@ -1,53 +1,13 @@
 import argparse
 import random
-from graph import Graph
-
-def read_cities_from_file(filename):
-    cities = {}
-    try:
-        with open(filename, 'r') as file:
-            for line in file:
-                parts = line.strip().split()
-                if len(parts) == 3:
-                    name = parts[0]
-                    latitude = float(parts[1])
-                    longitude = float(parts[2])
-                    cities[name] = (latitude, longitude)
-                else:
-                    print(f"Ignoring improperly formatted line: {line}")
-    except FileNotFoundError:
-        print(f"File '{filename}' not found.")
-    except Exception as e:
-        print(f"Error reading file '{filename}': {str(e)}")
-    return cities
-
-def add_edges_from_file(graph, filename):
-    cities = read_cities_from_file(filename)
-    for city1 in cities:
-        for city2 in cities:
-            if city1 != city2:
-                lat1, lon1 = cities[city1]
-                lat2, lon2 = cities[city2]
-                # Calculating distance using Haversine formula
-                distance = haversine(lon1, lat1, lon2, lat2)
-                graph.addEdge(city1, city2, distance)
-
-def haversine(lon1, lat1, lon2, lat2):
-    from math import radians, sin, cos, sqrt, atan2
-
-    # Convert decimal degrees to radians
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    radius_of_earth = 6371  # in kilometers
-    distance = radius_of_earth * c
-    return distance
-
-def get_successor(graph, prev_path, cities):
+from loader import read_cities_from_file, add_edges_from_file, load_graph
+from moves import move_search, steepest_two_opt
+from spatial import candidate_lists
+from construct import construct_path
+from bound import gap_target
+from tour import two_opt_search
+
+def get_successor(graph, prev_path, cities, instrument=None):
     successors = []
     goal = prev_path[0]
     for _ in range(10):
@@ -76,26 +36,20 @@ def get_successor(graph, prev_path, cities):
             current = random_neighbor
             all_visited += 1
 
+        if instrument is not None:
+            instrument.evaluations += 1
+            instrument.enter('scoring')
         successors.append((tsp_fitness(path, graph), all_visited, path))
+        if instrument is not None:
+            instrument.leave()
     return sorted(successors)[0]
 
 def tsp_fitness(path, graph):
-    distance = 0
-    for i in range(len(path) - 1):
-        current_node = path[i]
-        next_node = path[i + 1]
-        neighbors = graph.getNeighbours(current_node)
-        edge_weight = None
-        for neighbor, weight in neighbors:
-            if neighbor == next_node:
-                edge_weight = weight
-                break
-        if edge_weight is None:
-            raise ValueError(f"No edge between {current_node} and {next_node}")
-        distance += edge_weight
-    return distance
+    return graph.pathCost(path)
 
-def get_initial_path(graph, cities):
+def get_initial_path(graph, cities, method='random'):
+    if method != 'random':
+        return construct_path(graph, method)
     population = []
     current = random.choice(cities)
     goal = current
@@ -127,17 +81,43 @@ def get_initial_path(graph, cities):
         population.append((tsp_fitness(path, graph), all_visited, path))
     return sorted(population)[0]
 
-def hill_climbing(current_route, current_cost, num_iterations, graph, cities):
+def hill_climbing(current_route, current_cost, num_iterations, graph, cities, neighbourhood='regrow', target_gap=None, instrument=None, stopping=None):
+    target = gap_target(graph, target_gap, current_cost)
+    if neighbourhood == 'steepest':
+        #num_iterations budgets regrowth iterations, the steepest descent runs to its 2-opt local optimum like twolevel
+        return steepest_two_opt(graph, current_route, None, target=target, instrument=instrument, stopping=stopping)
+    if neighbourhood == 'twolevel':
+        return two_opt_search(graph, current_route, target=target, instrument=instrument, stopping=stopping)
+    if neighbourhood in ('moves', 'knn'):
+        candidates = candidate_lists(graph) if neighbourhood == 'knn' else None
+        return move_search(graph, current_route, num_iterations, candidates=candidates, target=target, instrument=instrument, stopping=stopping)
     best_route = current_route
     best_cost = current_cost
     for i in range(num_iterations):
-        neighbor_cost, all_visited, neighbor_route = get_successor(graph, best_route, cities)
+        if target is not None and best_cost <= target:
+            break
+        if instrument is not None:
+            instrument.enter('neighbours')
+        neighbor_cost, all_visited, neighbor_route = get_successor(graph, best_route, cities, instrument)
+        if instrument is not None:
+            instrument.switch('selection')
+            instrument.proposed += 1
         if neighbor_cost < current_cost:
             current_route = neighbor_route
             current_cost = neighbor_cost
+            if instrument is not None:
+                instrument.accepted += 1
         if current_cost < best_cost:
             best_route = current_route
             best_cost = current_cost
+        if instrument is not None:
+            instrument.leave()
+            instrument.iteration(i, current_cost, best_cost)
+        #every successor is picked from ten scored random regrowths
+        if stopping is not None and stopping.check(best_cost, 10 * (i + 1)):
+            break
+    if stopping is not None:
+        stopping.finish('target' if target is not None and best_cost <= target else 'iterations')
     return best_route, best_cost
 
 def main():
@@ -147,8 +127,7 @@ def main():
     args = parser.parse_args()
 
     if args.file:
-        cities_graph = Graph()
-        add_edges_from_file(cities_graph, args.file)
+        cities_graph = load_graph(args.file)
         cities = list(cities_graph.map.keys())
         num_iterations = 500
         current_cost, _, current_route = get_initial_path(cities_graph, cities)
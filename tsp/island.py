@@ -0,0 +1,136 @@
+import queue
+import random
+import time
+from multiprocessing import Event, Process, Queue
+import numpy as np
+from genetic import generate_random_path, evolve_population, tsp_fitness
+from multistart import SharedGraph, attach_graph, start_criteria
+from bound import gap_target
+
+def migration_targets(island, num_islands, topology):
+    '''Islands that receive the migrants of the given island'''
+    if num_islands < 2:
+        return []
+    if topology == 'ring':
+        return [(island + 1) % num_islands]
+    return [other for other in range(num_islands) if other != island]
+
+def _receive(inbox, done, poll=0.1):
+    '''Next batch of migrants from inbox, or None once done is set while waiting, as the island that would send it has stopped'''
+    while True:
+        try:
+            return inbox.get(timeout=poll)
+        except queue.Empty:
+            if done.is_set():
+                return None
+
+def _run_island(island, seed, spec, inboxes, results, num_islands, population_size, generations, migration_interval, migrants, topology,
+                criteria, target, deadline_at, done):
+    random.seed(seed)
+    graph, memory = attach_graph(spec)
+    cities = list(graph.map.keys())
+    start = time.perf_counter()
+    stopping = start_criteria(criteria, target, deadline_at)
+    population = [generate_random_path(cities) for _ in range(population_size)]
+    targets = migration_targets(island, num_islands, topology)
+    senders = sum(island in migration_targets(other, num_islands, topology) for other in range(num_islands))
+    received = 0
+    best_cost = float('inf')
+    reason = 'generations'
+    for generation in range(1, generations + 1):
+        population = evolve_population(population, graph)
+        if done.is_set():
+            reason = 'island'
+            break
+        if stopping is not None:
+            #as in genetic_algorithm, the closed tours are only scored when something watches them
+            best_cost = min(best_cost, min(graph.pathCost(path + path[:1]) for path in population))
+            if stopping.check(best_cost, generation * len(population)):
+                done.set()
+                break
+        if generation % migration_interval or generation == generations or not targets:
+            continue
+        #send copies of the best individuals, then replace the worst ones with what the neighbours sent
+        population.sort(key=lambda path: tsp_fitness(path, graph))
+        for target in targets:
+            inboxes[target].put([list(path) for path in population[:migrants]])
+        batches = [_receive(inboxes[island], done) for _ in range(senders)]
+        if any(batch is None for batch in batches):
+            reason = 'island'
+            break
+        incoming = [path for batch in batches for path in batch][:len(population)]
+        received += len(incoming)
+        if incoming:
+            population[-len(incoming):] = incoming
+    if done.is_set():
+        #migrants sent to islands that have stopped are never read, which mustn't keep this process from exiting
+        for target in targets:
+            inboxes[target].cancel_join_thread()
+    if stopping is not None:
+        reason = stopping.finish(reason)
+    costs = [tsp_fitness(path, graph) for path in population]
+    best = int(np.argmin(costs))
+    results.put((population[best], costs[best], {
+        "island": island,
+        "seed": seed,
+        "cost": costs[best],
+        "mean_cost": float(np.mean(costs)),
+        "migrants_received": received,
+        "seconds": time.perf_counter() - start,
+        "stopped": reason,
+    }))
+    memory.close()
+
+def _collect(results, islands, poll=1.0):
+    '''
+        One outcome per island off results. Every poll seconds without one the islands are checked, and should one have died
+        the others, which may be waiting for its migrants, are ended and a RuntimeError names it.
+    '''
+    outcomes = []
+    while len(outcomes) < len(islands):
+        try:
+            outcomes.append(results.get(timeout=poll))
+        except queue.Empty:
+            dead = [i for i, process in enumerate(islands) if process.exitcode not in (None, 0)]
+            if dead:
+                for process in islands:
+                    if process.is_alive():
+                        process.terminate()
+                    process.join()
+                raise RuntimeError(f"Island {dead[0]} died with exit code {islands[dead[0]].exitcode} before sending its result")
+    return outcomes
+
+def island_genetic_algorithm(graph, num_islands=4, population_size=20, generations=1000, migration_interval=50, migrants=2, topology='ring', seed=None,
+                             target_gap=None, stopping=None):
+    '''
+        Island model of genetic_algorithm: num_islands sub-populations evolve in separate processes over one shared distance matrix.
+        Every migration_interval generations each island sends copies of its best migrants individuals to its neighbours
+        on a 'ring' or 'full' topology, and they replace the worst individuals of the receiving island.
+        Every island checks its own copy of the stopping criteria with the target_gap cost as its target, as multi_start's
+        restarts do, and once one of them stops the others stop too, with 'island' as their reason.
+        Returns the best path found, its cost and per-island statistics.
+    '''
+    if topology not in ('ring', 'full'):
+        raise ValueError(f"Unknown migration topology: {topology}")
+    if migration_interval < 1:
+        raise ValueError(f"The migration interval must be at least one generation, not {migration_interval}")
+    target = gap_target(graph, target_gap)
+    deadline_at = None
+    if stopping is not None and stopping.deadline is not None:
+        deadline_at = time.time() + stopping.deadline - stopping.elapsed()
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(num_islands)]
+    inboxes = [Queue() for _ in range(num_islands)]
+    results = Queue()
+    done = Event()
+    with SharedGraph(graph) as shared:
+        islands = [Process(target=_run_island, args=(i, seeds[i], shared.spec, inboxes, results, num_islands, population_size,
+                                                     generations, migration_interval, migrants, topology, stopping, target, deadline_at, done))
+                   for i in range(num_islands)]
+        for process in islands:
+            process.start()
+        outcomes = _collect(results, islands)
+        for process in islands:
+            process.join()
+    best_path, best_cost, _ = min(outcomes, key=lambda outcome: outcome[1])
+    stats = sorted((stats for _, _, stats in outcomes), key=lambda stats: stats["island"])
+    return best_path, best_cost, stats
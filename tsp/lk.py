@@ -0,0 +1,136 @@
+import random
+from collections import deque
+from moves import MoveEngine, route_to_ids
+from spatial import candidate_lists
+
+EPSILON = 1e-9
+
+def or_opt_move(engine, t1, candidates):
+    '''
+        Improving segment insertion that places a segment of up to three cities starting at t1 next to a candidate.
+        Returns the move, its delta and how many insertions were evaluated.
+    '''
+    n, pos = engine.n, engine.pos
+    i = int(pos[t1])
+    evaluations = 0
+    for length in range(1, engine.max_segment + 1):
+        for c in candidates[t1]:
+            after = int(pos[c])
+            #insert after c keeping the orientation, or before c reversed, so t1 always ends up next to c
+            for j, reverse in ((after, False), ((after - 1) % n, True)):
+                offset = (j - i) % n
+                if offset < length or offset == n - 1:
+                    continue
+                delta = engine.or_opt_delta(i, length, j, reverse)
+                evaluations += 1
+                if delta < -EPSILON:
+                    return ('oropt', i, length, j, reverse), delta, evaluations
+    return None, 0, evaluations
+
+def sequential_move(engine, t1, candidates):
+    '''
+        Lin-Kernighan style search of depth three from t1.
+        Edges (t1, t2), (t3, t4), (t5, t6) are broken and (t2, t3), (t4, t5), (t6, t1) are added,
+        extending the chain only while the partial gain stays positive, and closing early as a 2-opt move when that already helps.
+        Returns the move, the cities it touches and how many closing gains were evaluated.
+    '''
+    n, tour, pos, dist = engine.n, engine.tour, engine.pos, engine.dist
+    evaluations = 0
+    def around(city):
+        p = pos[city]
+        return tour[(p + 1) % n], tour[p - 1]
+    for t2 in around(t1):
+        d12 = dist[t1, t2]
+        for t3 in candidates[t2]:
+            g1 = d12 - dist[t2, t3]
+            if g1 <= EPSILON:
+                break
+            if t3 == t1:
+                continue
+            for t4 in around(t3):
+                if t4 == t2:
+                    continue
+                d34 = dist[t3, t4]
+                evaluations += 1
+                if g1 + d34 - dist[t4, t1] > EPSILON:
+                    move = engine.reconnect([(t1, t2), (t3, t4)], [(t2, t3), (t4, t1)])
+                    if move is not None:
+                        return move, (t1, t2, t3, t4), evaluations
+                for t5 in candidates[t4]:
+                    g2 = g1 + d34 - dist[t4, t5]
+                    if g2 <= EPSILON:
+                        break
+                    if t5 == t3 or t5 == t2 or t5 == t1:
+                        continue
+                    for t6 in around(t5):
+                        if t6 == t4 or t6 == t1:
+                            continue
+                        evaluations += 1
+                        if g2 + dist[t5, t6] - dist[t6, t1] > EPSILON:
+                            move = engine.reconnect([(t1, t2), (t3, t4), (t5, t6)], [(t2, t3), (t4, t5), (t6, t1)])
+                            if move is not None:
+                                return move, (t1, t2, t3, t4, t5, t6), evaluations
+    return None, (), evaluations
+
+def lk_search(graph, route, candidates=None, rng=random, max_moves=None, stats=None, instrument=None, stopping=None):
+    '''
+        Local optimiser combining Or-opt segment insertion with 2-opt and sequential 3-opt moves drawn from candidate lists.
+        Don't-look bits keep a queue of the cities worth examining: a city leaves the queue when no improving move starts
+        from it, and re-enters only when one of its tour edges changes. Stops at a local optimum or after max_moves moves.
+        Returns the closed route as names and its cost; the evaluated and applied moves are counted into stats when given.
+        With an instrument, searching from a city is timed as scoring, applying a move as selection,
+        and a record is added every n cities taken off the queue; the stopping criteria are checked as often.
+    '''
+    if instrument is not None:
+        instrument.enter('init')
+    if candidates is None:
+        candidates = candidate_lists(graph)
+    candidates = candidates.tolist()
+    engine = MoveEngine(graph.dist, route_to_ids(graph, route), rng=rng, instrument=instrument)
+    order = engine.tour.tolist()
+    rng.shuffle(order)
+    queue = deque(order)
+    active = set(order)
+    moves = evaluations = popped = 0
+    if instrument is not None:
+        instrument.leave()
+    while queue and (max_moves is None or moves < max_moves):
+        if instrument is not None:
+            instrument.enter('scoring')
+        t1 = queue.popleft()
+        active.discard(t1)
+        move, delta, evaluated = or_opt_move(engine, t1, candidates)
+        if move is not None:
+            i, length, j = move[1], move[2], move[3]
+            touched = [engine.tour[(i - 1) % engine.n], engine.tour[(i + length) % engine.n], engine.tour[j], engine.tour[(j + 1) % engine.n]]
+            touched += [engine.tour[(i + k) % engine.n] for k in (0, length - 1)]
+        else:
+            move, touched, more = sequential_move(engine, t1, candidates)
+            evaluated += more
+            if move is not None:
+                delta = engine.delta(move)
+        evaluations += evaluated
+        if instrument is not None:
+            instrument.evaluations += evaluated
+            instrument.proposed += evaluated
+            instrument.leave()
+        if move is not None:
+            engine.apply(move, delta)
+            moves += 1
+            for city in (t1, *touched):
+                if city not in active:
+                    active.add(city)
+                    queue.append(city)
+        if instrument is not None or stopping is not None:
+            popped += 1
+            if popped % engine.n == 0:
+                if instrument is not None:
+                    instrument.iteration(popped // engine.n, engine.cost, engine.cost, queued=len(queue))
+                if stopping is not None and stopping.check(engine.cost, evaluations):
+                    break
+    if stopping is not None:
+        stopping.finish('converged' if not queue else 'iterations')
+    if stats is not None:
+        stats.update(evaluations=evaluations, moves=moves)
+    names = graph.toNames(engine.tour)
+    return names + names[:1], engine.cost
@@ -0,0 +1,212 @@
+import hashlib
+import math
+import os
+import numpy as np
+from graph import MatrixGraph, LazyGraph
+from tsplib import read_tsplib, tsplib_distance_matrix, geo_radians
+
+RADIUS_OF_EARTH = 6371  # in kilometers
+
+# Directory of the on-disk distance matrix cache, used when load_graph isn't given one
+CACHE_DIR_VARIABLE = 'TSP_DISTANCE_CACHE'
+
+def read_cities_from_file(filename):
+    cities = {}
+    try:
+        with open(filename, 'r') as file:
+            for line in file:
+                parts = line.strip().split()
+                if len(parts) == 3:
+                    name = parts[0]
+                    latitude = float(parts[1])
+                    longitude = float(parts[2])
+                    cities[name] = (latitude, longitude)
+                else:
+                    print(f"Ignoring improperly formatted line: {line}")
+    except FileNotFoundError:
+        print(f"File '{filename}' not found.")
+    except Exception as e:
+        print(f"Error reading file '{filename}': {str(e)}")
+    return cities
+
+def read_city_columns(filename, chunk_lines=1 << 16):
+    '''
+        Streams a `name latitude longitude` file in chunks of lines into a names array and an (n, 2) coordinate array.
+        Each chunk is converted to NumPy before the next one is read, so peak memory follows the instance size
+        rather than a Python object per city. Malformed lines, those without three fields or with a latitude
+        or longitude that isn't a finite number, are counted and reported once. A city named again is reported too,
+        and only its first line is kept, as read_cities_from_file kept one node per name.
+    '''
+    names, coordinates = [], []
+    ignored = 0
+    with open(filename, 'r') as file:
+        while True:
+            lines = file.readlines(chunk_lines * 32)
+            if not lines:
+                break
+            rows = [line.split() for line in lines]
+            good = [row for row in rows if len(row) == 3]
+            ignored += sum(1 for row in rows if row and len(row) != 3)
+            if not good:
+                continue
+            try:
+                values = np.array([row[1:] for row in good], dtype=np.float64)
+            except ValueError:
+                #some row doesn't parse, convert them one by one
+                values = np.array([parse_coordinates(row) for row in good], dtype=np.float64)
+            valid = np.isfinite(values).all(axis=1)
+            ignored += int(np.count_nonzero(~valid))
+            names.append(np.array([row[0] for row in good])[valid])
+            coordinates.append(values[valid])
+    if ignored:
+        print(f"Ignored {ignored} improperly formatted lines in '{filename}'")
+    if not names:
+        return np.array([], dtype=str), np.empty((0, 2))
+    names, coordinates = np.concatenate(names), np.concatenate(coordinates)
+    _, first = np.unique(names, return_index=True)
+    if len(first) < len(names):
+        print(f"Ignored {len(names) - len(first)} repeated cities in '{filename}', keeping the first line of each")
+        first.sort()
+        names, coordinates = names[first], coordinates[first]
+    return names, coordinates
+
+def parse_coordinates(row):
+    '''(latitude, longitude) of a `name latitude longitude` row, NaN when they aren't numbers'''
+    try:
+        return float(row[1]), float(row[2])
+    except ValueError:
+        return math.nan, math.nan
+
+def save_columns(path, names, coordinates):
+    '''Writes the parsed instance as a binary columnar .npz file'''
+    with open(path, 'wb') as file:
+        np.savez(file, names=names, latitude=coordinates[:, 0], longitude=coordinates[:, 1])
+
+def load_columns(filename, column_cache=False):
+    '''
+        read_city_columns, going through a binary columnar cache next to the file when column_cache is set.
+        The cache is rebuilt whenever the source file is newer than it.
+    '''
+    path = f"{filename}.columns.npz"
+    if column_cache and os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(filename):
+        with np.load(path) as columns:
+            return columns['names'], np.stack((columns['latitude'], columns['longitude']), axis=1)
+    names, coordinates = read_city_columns(filename)
+    if column_cache:
+        save_columns(path, names, coordinates)
+    return names, coordinates
+
+def load_tsplib_graph(filename, dtype=np.float64):
+    '''Reads a TSPLIB .tsp file into a MatrixGraph whose nodes are named by their TSPLIB number'''
+    instance = read_tsplib(filename)
+    n = int(instance['DIMENSION'])
+    dist = tsplib_distance_matrix(instance, dtype)
+    coordinates, planar = None, instance['coordinates']
+    if instance.get('EDGE_WEIGHT_TYPE') == 'GEO':
+        coordinates, planar = np.degrees(geo_radians(planar)), None
+    return MatrixGraph.fromMatrix([str(i) for i in range(1, n + 1)], dist, coordinates, planar)
+
+def haversine(lon1, lat1, lon2, lat2):
+    # Convert decimal degrees to radians
+    lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
+
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return RADIUS_OF_EARTH * c
+
+def haversine_matrix(lat, lon, dtype=np.float64, block_size=1024):
+    '''
+        Pairwise great-circle distances between all the points, in kilometers.
+        Each block is the same haversine as haversine(), sin^2(dlat / 2) + cos(lat1) cos(lat2) sin^2(dlon / 2),
+        broadcast over a block of rows and computed in place; it stays accurate for nearby points,
+        where the cosine of the angle between unit vectors would lose every significant digit.
+        Rows are processed in blocks against the columns at or after the block start,
+        so only the upper triangle is ever computed and it is mirrored into the lower one.
+    '''
+    half_lat = np.radians(np.asarray(lat, dtype=np.float64)) / 2
+    half_lon = np.radians(np.asarray(lon, dtype=np.float64)) / 2
+    cos_lat = np.cos(2 * half_lat)
+    n = len(half_lat)
+    dist = np.empty((n, n), dtype=dtype)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = np.subtract(half_lat[start:stop, None], half_lat[None, start:])
+        np.sin(block, out=block)
+        block *= block
+        across = np.subtract(half_lon[start:stop, None], half_lon[None, start:])
+        np.sin(across, out=across)
+        across *= across
+        #one product of the two cosines, so that the diagonal block comes out exactly symmetric
+        across *= cos_lat[start:stop, None] * cos_lat[None, start:]
+        block += across
+        np.clip(block, 0, 1, out=block)
+        np.sqrt(block, out=block)
+        np.arcsin(block, out=block)
+        block *= 2 * RADIUS_OF_EARTH
+        dist[start:stop, start:] = block
+        dist[start:, start:stop] = block.T
+    np.fill_diagonal(dist, 0)
+    return dist
+
+def haversine_pairs(lat1, lon1, lat2, lon2):
+    '''Elementwise haversine distance in kilometers between broadcastable arrays of coordinates in degrees'''
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIUS_OF_EARTH * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def instance_hash(coordinates):
+    '''Hex digest identifying an instance by its parsed coordinates, in file order'''
+    coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+    digest = hashlib.sha256(str(coordinates.shape).encode())
+    digest.update(coordinates.tobytes())
+    return digest.hexdigest()
+
+def cached_distance_matrix(coordinates, cache_dir):
+    '''
+        Distance matrix of the coordinates, memory-mapped read-only from a float32 .npy file in cache_dir.
+        The file is named after instance_hash and written once, through a temporary file so concurrent
+        runs never see a partial matrix; later runs and other processes share it through the page cache.
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{instance_hash(coordinates)}.npy")
+    if not os.path.exists(path):
+        dist = haversine_matrix(coordinates[:, 0], coordinates[:, 1], dtype=np.float32)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as file:
+            np.save(file, dist)
+        os.replace(temporary, path)
+    return np.load(path, mmap_mode='r')
+
+def load_graph(filename, dtype=np.float64, cache_dir=None, column_cache=False):
+    '''
+        Reads a cities file and returns a MatrixGraph with every pairwise haversine distance.
+        With a cache_dir (or the TSP_DISTANCE_CACHE environment variable) the matrix comes from
+        cached_distance_matrix instead, as a read-only float32 memory map.
+        TSPLIB .tsp files are handed to load_tsplib_graph.
+    '''
+    if filename.lower().endswith('.tsp'):
+        return load_tsplib_graph(filename, dtype)
+    names, coordinates = load_columns(filename, column_cache)
+    names = names.tolist()
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_VARIABLE)
+    if cache_dir:
+        dist = cached_distance_matrix(coordinates, cache_dir)
+    else:
+        dist = haversine_matrix(coordinates[:, 0], coordinates[:, 1], dtype=dtype)
+    return MatrixGraph.fromMatrix(names, dist, coordinates)
+
+def load_lazy_graph(filename, cache_size=1 << 20, dtype=np.float64, column_cache=False):
+    '''Reads a cities file into a LazyGraph that computes haversine distances on demand, caching up to cache_size pairs'''
+    names, coordinates = load_columns(filename, column_cache)
+    return LazyGraph(names.tolist(), coordinates, haversine_pairs, capacity=cache_size, dtype=dtype)
+
+def add_edges_from_file(graph, filename):
+    # Adds every undirected edge once, reusing the vectorised distances
+    source = load_graph(filename)
+    names = source.names
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            graph.addEdge(names[i], names[j], float(source.dist[i, j]))
@@ -0,0 +1,341 @@
+import random
+import numpy as np
+
+class MoveEngine:
+    '''
+        Neighbourhood of a closed tour under 2-opt, Or-opt and swap moves.
+        The tour is an array of city ids over a symmetric distance matrix and the closing edge is implicit.
+        Each move's cost change only looks at the four to eight edges it touches, so evaluating a move is O(1),
+        and the tour is rewritten in place only when a move is applied.
+        When candidates (an n x k array of each city's nearest neighbours) is given,
+        moves are drawn so that they create an edge between a city and one of its candidates.
+        Moves are tuples: ('2opt', i, j) reverses positions i+1..j,
+        ('oropt', i, length, j, reverse) moves the segment starting at position i to after position j,
+        ('swap', i, j) exchanges the cities at positions i and j,
+        ('3opt', p1, p2, p3, swap, reverse_a, reverse_b) cuts after positions p1 < p2 < p3 and reconnects
+        the segments A = p1+1..p2 and B = p2+1..p3, optionally reversed and optionally in the order B, A.
+        With an instrument, proposals are timed as neighbour generation then scoring, applied moves as selection, and both are counted.
+    '''
+    MIN_CITIES = 5
+
+    def __init__(self, dist, tour, rng=random, max_segment=3, candidates=None, instrument=None):
+        self.dist = dist
+        self.tour = np.array(tour, dtype=np.intp)
+        self.n = len(self.tour)
+        if self.n < self.MIN_CITIES:
+            raise ValueError(f"Move based search needs at least {self.MIN_CITIES} cities")
+        self.rng = rng
+        self.max_segment = max_segment
+        self.candidates = candidates
+        self.pos = np.empty(self.n, dtype=np.intp)
+        self.pos[self.tour] = np.arange(self.n)
+        self.cost = float(dist[self.tour, np.roll(self.tour, -1)].sum(dtype=np.float64))
+        self.proposed = 0
+        self.applied = 0
+        self.instrument = instrument
+
+    def two_opt_delta(self, i, j):
+        n, tour, dist = self.n, self.tour, self.dist
+        a, b = tour[i], tour[(i + 1) % n]
+        c, d = tour[j], tour[(j + 1) % n]
+        return dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+
+    def or_opt_delta(self, i, length, j, reverse):
+        n, tour, dist = self.n, self.tour, self.dist
+        p, first = tour[i - 1], tour[i]
+        last, nxt = tour[(i + length - 1) % n], tour[(i + length) % n]
+        c, d = tour[j], tour[(j + 1) % n]
+        if reverse:
+            added = dist[c, last] + dist[first, d]
+        else:
+            added = dist[c, first] + dist[last, d]
+        return dist[p, nxt] + added - dist[p, first] - dist[last, nxt] - dist[c, d]
+
+    def swap_delta(self, i, j):
+        n, tour, dist = self.n, self.tour, self.dist
+        if (i + 1) % n == j:
+            a, b, c, d = tour[i - 1], tour[i], tour[j], tour[(j + 1) % n]
+            return dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+        if (j + 1) % n == i:
+            return self.swap_delta(j, i)
+        a, b, c = tour[i - 1], tour[i], tour[(i + 1) % n]
+        x, y, z = tour[j - 1], tour[j], tour[(j + 1) % n]
+        return dist[a, y] + dist[y, c] + dist[x, b] + dist[b, z] - dist[a, b] - dist[b, c] - dist[x, y] - dist[y, z]
+
+    def three_opt_edges(self, p1, p2, p3, swap, reverse_a, reverse_b):
+        '''The three edges a 3-opt reconnection adds'''
+        tour = self.tour
+        a = (tour[p1 + 1], tour[p2])
+        b = (tour[p2 + 1], tour[p3])
+        if reverse_a:
+            a = a[::-1]
+        if reverse_b:
+            b = b[::-1]
+        x, y = (b, a) if swap else (a, b)
+        return [(tour[p1], x[0]), (x[1], y[0]), (y[1], tour[(p3 + 1) % self.n])]
+
+    def three_opt_delta(self, p1, p2, p3, swap, reverse_a, reverse_b):
+        n, tour, dist = self.n, self.tour, self.dist
+        removed = dist[tour[p1], tour[p1 + 1]] + dist[tour[p2], tour[p2 + 1]] + dist[tour[p3], tour[(p3 + 1) % n]]
+        return sum(dist[u, v] for u, v in self.three_opt_edges(p1, p2, p3, swap, reverse_a, reverse_b)) - removed
+
+    def edge_position(self, u, v):
+        '''Position p such that (u, v) is the tour edge between positions p and p + 1, or None'''
+        n, tour, pos = self.n, self.tour, self.pos
+        if tour[(pos[u] + 1) % n] == v:
+            return int(pos[u])
+        if tour[(pos[v] + 1) % n] == u:
+            return int(pos[v])
+        return None
+
+    def reconnect(self, removed, added):
+        '''
+            Finds the 2-opt or 3-opt move that removes the given tour edges and adds exactly the given ones,
+            or returns None when no reconnection yields a single cycle.
+        '''
+        positions = [self.edge_position(u, v) for u, v in removed]
+        if None in positions or len(set(positions)) != len(positions):
+            return None
+        wanted = {frozenset(edge) for edge in added}
+        if len(positions) == 2:
+            i, j = sorted(positions)
+            move = ('2opt', i, j)
+            tour, n = self.tour, self.n
+            edges = {frozenset((tour[i], tour[j])), frozenset((tour[i + 1], tour[(j + 1) % n]))}
+            return move if edges == wanted else None
+        p1, p2, p3 = sorted(positions)
+        for swap in (False, True):
+            for reverse_a in (False, True):
+                for reverse_b in (False, True):
+                    if not (swap or reverse_a or reverse_b):
+                        continue
+                    edges = {frozenset(edge) for edge in self.three_opt_edges(p1, p2, p3, swap, reverse_a, reverse_b)}
+                    if edges == wanted:
+                        return ('3opt', p1, p2, p3, swap, reverse_a, reverse_b)
+        return None
+
+    def delta(self, move):
+        kind = move[0]
+        if kind == '2opt':
+            return self.two_opt_delta(move[1], move[2])
+        if kind == 'oropt':
+            return self.or_opt_delta(move[1], move[2], move[3], move[4])
+        if kind == '3opt':
+            return self.three_opt_delta(*move[1:])
+        return self.swap_delta(move[1], move[2])
+
+    def random_move(self):
+        '''Draws a random valid move: half of the time 2-opt, the rest split between Or-opt and swap'''
+        n, rng = self.n, self.rng
+        r = rng.random()
+        if r < 0.5:
+            i = rng.randrange(n)
+            j = (i + rng.randint(2, n - 2)) % n
+            return ('2opt', min(i, j), max(i, j))
+        if r < 0.8:
+            length = rng.randint(1, self.max_segment)
+            i = rng.randrange(n)
+            #the insertion point must lie outside the segment and not right before it
+            j = (i + length + rng.randrange(n - length - 1)) % n
+            return ('oropt', i, length, j, rng.random() < 0.5)
+        i = rng.randrange(n)
+        j = (i + rng.randint(1, n - 1)) % n
+        return ('swap', i, j)
+
+    def candidate_move(self):
+        '''Draws a move that links a random city to one of its nearest neighbours, or None if that isn't a valid move'''
+        n, rng, pos = self.n, self.rng, self.pos
+        i = rng.randrange(n)
+        neighbours = self.candidates[self.tour[i]]
+        j = int(pos[neighbours[rng.randrange(len(neighbours))]])
+        r = rng.random()
+        if r < 0.5:
+            #reversing between the two positions makes them adjacent
+            i, j = min(i, j), max(i, j)
+            if j - i < 2 or j - i > n - 2:
+                return None
+            return ('2opt', i, j)
+        if r < 0.8:
+            length = rng.randint(1, self.max_segment)
+            if (j - i) % n < length or (j - i) % n == n - 1:
+                return None
+            return ('oropt', i, length, j, False)
+        #bring the city right after its neighbour
+        j = (j + 1) % n
+        if j == i:
+            return None
+        return ('swap', i, j)
+
+    def propose(self):
+        '''Returns a random move together with its cost change'''
+        self.proposed += 1
+        instrument = self.instrument
+        if instrument is not None:
+            instrument.enter('neighbours')
+        move = self.candidate_move() if self.candidates is not None else None
+        if move is None:
+            move = self.random_move()
+        if instrument is None:
+            return move, self.delta(move)
+        instrument.switch('scoring')
+        delta = self.delta(move)
+        instrument.leave()
+        instrument.proposed += 1
+        instrument.evaluations += 1
+        return move, delta
+
+    def apply(self, move, delta=None):
+        if delta is None:
+            delta = self.delta(move)
+        if self.instrument is not None:
+            self.instrument.accepted += 1
+            with self.instrument.phase('selection'):
+                return self.__apply(move, delta)
+        self.__apply(move, delta)
+
+    def __apply(self, move, delta):
+        kind, tour, n = move[0], self.tour, self.n
+        if kind == '2opt':
+            i, j = move[1], move[2]
+            if j - i <= n // 2:
+                idx = np.arange(i + 1, j + 1)
+            else:
+                #reversing the complementary segment gives the same cycle with fewer writes
+                idx = np.arange(j + 1, j + 1 + n - (j - i)) % n
+            tour[idx] = tour[idx[::-1]]
+            self.pos[tour[idx]] = idx
+        elif kind == 'oropt':
+            i, length, j, reverse = move[1:]
+            seg_idx = np.arange(i, i + length) % n
+            segment = tour[seg_idx]
+            if reverse:
+                segment = segment[::-1]
+            anchor = tour[j]
+            rest = np.delete(tour, seg_idx)
+            at = int(np.flatnonzero(rest == anchor)[0]) + 1
+            tour[:] = np.concatenate((rest[:at], segment, rest[at:]))
+            self.pos[tour] = np.arange(n)
+        elif kind == '3opt':
+            p1, p2, p3, swap, reverse_a, reverse_b = move[1:]
+            a = tour[p1 + 1:p2 + 1]
+            b = tour[p2 + 1:p3 + 1]
+            if reverse_a:
+                a = a[::-1]
+            if reverse_b:
+                b = b[::-1]
+            tour[p1 + 1:p3 + 1] = np.concatenate((b, a) if swap else (a, b))
+            self.pos[tour[p1 + 1:p3 + 1]] = np.arange(p1 + 1, p3 + 1)
+        else:
+            i, j = move[1], move[2]
+            tour[i], tour[j] = tour[j], tour[i]
+            self.pos[tour[i]], self.pos[tour[j]] = i, j
+        self.cost += float(delta)
+        self.applied += 1
+
+    def route(self):
+        '''Closed route as a list of ids, starting and ending at the same city'''
+        ids = self.tour.tolist()
+        return ids + ids[:1]
+
+def route_to_ids(graph, route):
+    '''Turns a route of city names into a tour of distinct ids, dropping repeated visits'''
+    return graph.toIds(list(dict.fromkeys(route)))
+
+def move_search(graph, route, num_iterations, rng=random, candidates=None, target=None, stats=None, instrument=None, stopping=None):
+    '''
+        First-improvement local search: runs num_iterations epochs of one proposed move per city
+        and applies every move that shortens the tour, stopping early once the cost reaches target
+        or when the stopping criteria, checked after every epoch, say so.
+        Returns the closed route as names and its cost; the evaluated and applied moves are counted into stats when given,
+        and every epoch is recorded by instrument when given.
+    '''
+    if instrument is not None:
+        instrument.enter('init')
+    engine = MoveEngine(graph.dist, route_to_ids(graph, route), rng=rng, candidates=candidates, instrument=instrument)
+    if instrument is not None:
+        instrument.leave()
+    for epoch in range(num_iterations):
+        if target is not None and engine.cost <= target:
+            break
+        for _ in range(engine.n):
+            move, delta = engine.propose()
+            if delta < -1e-9:
+                engine.apply(move, delta)
+        if instrument is not None:
+            instrument.iteration(epoch, engine.cost, engine.cost)
+        if stopping is not None and stopping.check(engine.cost, engine.proposed):
+            break
+    if stopping is not None:
+        stopping.finish('target' if target is not None and engine.cost <= target else 'iterations')
+    if stats is not None:
+        stats.update(evaluations=engine.proposed, moves=engine.applied)
+    names = graph.toNames(engine.tour)
+    return names + names[:1], engine.cost
+
+def two_opt_mask(n):
+    '''Position pairs (i, j) that are not valid 2-opt moves: j < i + 2, and the two edges around position 0 which share a city'''
+    invalid = np.tri(n, n, 1, dtype=bool)
+    invalid[0, n - 1] = True
+    return invalid
+
+def best_two_opt_move(dist, tour, invalid=None):
+    '''
+        Evaluates every 2-opt move of the tour at once with broadcasted gathers from the distance matrix.
+        Returns the move ('2opt', i, j) with the lowest cost change and that change.
+    '''
+    n = len(tour)
+    if invalid is None:
+        invalid = two_opt_mask(n)
+    #one gather over the closed tour serves both d(t[i], t[j]) and d(t[i + 1], t[j + 1]) as shifted views
+    closed = np.append(tour, tour[0])
+    pairs = dist[np.ix_(closed, closed)]
+    edges = pairs.diagonal(1)
+    delta = pairs[:n, :n] + pairs[1:, 1:]
+    delta -= edges[:, None]
+    delta -= edges[None, :]
+    delta[invalid] = np.inf
+    i, j = np.unravel_index(np.argmin(delta), delta.shape)
+    return ('2opt', int(i), int(j)), float(delta[i, j])
+
+def steepest_two_opt(graph, route, max_iterations=None, target=None, stats=None, instrument=None, stopping=None):
+    '''
+        Deterministic steepest descent: applies the best 2-opt move of the whole neighbourhood until none improves,
+        for max_iterations moves, until the cost reaches target or until the stopping criteria end it.
+        Meant for dense instances up to a few thousand cities.
+        The evaluated and applied moves are counted into stats when given, and every sweep is recorded by instrument
+        (as scoring, since the vectorised sweep generates and scores the moves in one go).
+        Returns the closed route as names and its cost.
+    '''
+    dist = graph.dist
+    if instrument is not None:
+        instrument.enter('init')
+    engine = MoveEngine(dist, route_to_ids(graph, route), instrument=instrument)
+    invalid = two_opt_mask(engine.n)
+    if instrument is not None:
+        instrument.leave()
+    iterations = sweeps = 0
+    reason = 'iterations'
+    while (max_iterations is None or iterations < max_iterations) and (target is None or engine.cost > target):
+        if instrument is not None:
+            instrument.enter('scoring')
+        move, delta = best_two_opt_move(dist, engine.tour, invalid)
+        sweeps += 1
+        if instrument is not None:
+            instrument.leave()
+            instrument.evaluations += engine.n * (engine.n - 3) // 2
+            instrument.proposed += 1
+        if delta >= -1e-9:
+            reason = 'converged'
+            break
+        engine.apply(move, delta)
+        iterations += 1
+        if instrument is not None:
+            instrument.iteration(sweeps, engine.cost, engine.cost)
+        if stopping is not None and stopping.check(engine.cost, sweeps * (engine.n * (engine.n - 3) // 2)):
+            break
+    if stopping is not None:
+        stopping.finish('target' if target is not None and engine.cost <= target else reason)
+    if stats is not None:
+        stats.update(evaluations=sweeps * (engine.n * (engine.n - 3) // 2), moves=iterations)
+    names = graph.toNames(engine.tour)
+    return names + names[:1], engine.cost
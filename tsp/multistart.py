@@ -0,0 +1,118 @@
+import copy
+import os
+import random
+import time
+from multiprocessing import Pool, shared_memory
+import numpy as np
+from graph import MatrixGraph
+from hill import get_initial_path, hill_climbing
+from simulated import simulated_annealing
+from bound import gap_target
+from common.stopping import StoppingCriteria
+
+class SharedGraph:
+    '''
+        Copy of a MatrixGraph's distance matrix in a shared memory block.
+        spec is a small picklable tuple that worker processes hand to attach_graph to map the block instead of copying it.
+        Only a numeric matrix can be shared, a LazyGraph has to be loaded densely first.
+    '''
+    def __init__(self, graph):
+        if not isinstance(graph.dist, np.ndarray) or graph.dist.dtype.kind not in 'fiu':
+            raise TypeError(f"Only a graph backed by a numeric distance matrix can be shared between processes, not {type(graph.dist).__name__}")
+        dist = np.ascontiguousarray(graph.dist)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(dist.nbytes, 1))
+        np.ndarray(dist.shape, dtype=dist.dtype, buffer=self.memory.buf)[:] = dist
+        self.spec = (self.memory.name, dist.shape, dist.dtype.str, graph.names, graph.coordinates, graph.planar)
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def attach_graph(spec):
+    '''Maps a SharedGraph inside a worker, returning the graph and the memory block that must outlive it'''
+    name, shape, dtype, names, coordinates, planar = spec
+    try:
+        # Python 3.13+: don't let the worker's resource tracker unlink the parent's block
+        memory = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=name)
+    dist = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    return MatrixGraph.fromMatrix(names, dist, coordinates, planar), memory
+
+# Set in every pool worker by _attach, so each worker maps the shared matrix once
+_worker_graph = None
+_worker_memory = None
+
+def _attach(spec):
+    global _worker_graph, _worker_memory
+    _worker_graph, _worker_memory = attach_graph(spec)
+
+def start_criteria(criteria, target, deadline_at):
+    '''
+        Fresh stopping criteria for one restart: a copy of criteria (or none at all) with its clock restarted,
+        the target lowered to target and the deadline turned back into seconds left until the wall-clock time deadline_at.
+    '''
+    if criteria is None and target is None:
+        return None
+    stopping = copy.copy(criteria) if criteria is not None else StoppingCriteria()
+    stopping.start()
+    if target is not None:
+        stopping.target = target if stopping.target is None else min(stopping.target, target)
+    if deadline_at is not None:
+        stopping.deadline = max(deadline_at - time.time(), 0.0)
+    return stopping
+
+def _run_start(task):
+    '''One independent restart, run inside a worker process'''
+    index, seed, algorithm, neighbourhood, init, criteria, target, deadline_at, params = task
+    random.seed(seed)
+    graph = _worker_graph
+    cities = list(graph.map.keys())
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    stopping = start_criteria(criteria, target, deadline_at)
+    current_cost, _, current_route = get_initial_path(graph, cities, init)
+    initial_cost = current_cost
+    if algorithm == 'sa':
+        route, cost = simulated_annealing(current_route, current_cost, params.get('start_temp', 100), params.get('end_temp', 0.1),
+                                          params.get('cooling_rate', 0.99), params.get('num_iterations', 10000), graph, neighbourhood=neighbourhood, stopping=stopping)
+    else:
+        route, cost = hill_climbing(current_route, current_cost, params.get('num_iterations', 500), graph, cities, neighbourhood=neighbourhood, stopping=stopping)
+    stats = {
+        "start": index,
+        "seed": seed,
+        "pid": os.getpid(),
+        "initial_cost": initial_cost,
+        "cost": cost,
+        "seconds": time.perf_counter() - start,
+        "cpu_seconds": time.process_time() - cpu_start,
+        "stopped": stopping.reason if stopping is not None else None,
+    }
+    return route, cost, stats
+
+def multi_start(graph, num_starts, algorithm='ha', neighbourhood='moves', workers=None, seed=None, init='random', target_gap=None, stopping=None, **params):
+    '''
+        Runs num_starts independent hill climbing (algorithm='ha') or annealing (algorithm='sa') restarts in a process pool.
+        The distance matrix is copied once into a shared memory block that every worker maps instead of unpickling its own graph,
+        and each restart gets its own RNG stream spawned from seed and starts from an init route (see get_initial_path).
+        Every restart checks its own copy of the stopping criteria: the deadline still counts from when stopping was made,
+        and the target_gap cost is computed once here and becomes each restart's target.
+        Returns the best route, its cost and a list of per-restart statistics.
+    '''
+    target = gap_target(graph, target_gap)
+    deadline_at = None
+    if stopping is not None and stopping.deadline is not None:
+        deadline_at = time.time() + stopping.deadline - stopping.elapsed()
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(num_starts)]
+    tasks = [(i, seeds[i], algorithm, neighbourhood, init, stopping, target, deadline_at, params) for i in range(num_starts)]
+    with SharedGraph(graph) as shared:
+        with Pool(processes=workers or os.cpu_count(), initializer=_attach, initargs=(shared.spec,)) as pool:
+            results = pool.map(_run_start, tasks)
+    best_route, best_cost, _ = min(results, key=lambda result: result[1])
+    return best_route, best_cost, [stats for _, _, stats in results]
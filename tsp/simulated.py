@@ -1,65 +1,18 @@
 import argparse
 import math
 import random
-from graph import Graph
-
-def read_cities_from_file(filename):
-    cities = {}
-    try:
-        with open(filename, 'r') as file:
-            for line in file:
-                parts = line.strip().split()
-                if len(parts) == 3:
-                    name = parts[0]
-                    latitude = float(parts[1])
-                    longitude = float(parts[2])
-                    cities[name] = (latitude, longitude)
-                else:
-                    print(f"Ignoring improperly formatted line: {line}")
-    except FileNotFoundError:
-        print(f"File '{filename}' not found.")
-    except Exception as e:
-        print(f"Error reading file '{filename}': {str(e)}")
-    return cities
-
-def add_edges_from_file(graph, filename):
-    cities = read_cities_from_file(filename)
-    for city1 in cities:
-        for city2 in cities:
-            if city1 != city2:
-                lat1, lon1 = cities[city1]
-                lat2, lon2 = cities[city2]
-                # Calculating distance using Haversine formula
-                distance = haversine(lon1, lat1, lon2, lat2)
-                graph.addEdge(city1, city2, distance)
-
-def haversine(lon1, lat1, lon2, lat2):
-    # Haversine formula implementation
-    radius_of_earth = 6371  # in kilometers
-    dlon = math.radians(lon2 - lon1)
-    dlat = math.radians(lat2 - lat1)
-    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = radius_of_earth * c
-    return distance
+from loader import read_cities_from_file, add_edges_from_file, load_graph
+from moves import MoveEngine, route_to_ids
+from spatial import candidate_lists
+from construct import construct_path
+from bound import gap_target
 
 def tsp_fitness(path, graph):
-    distance = 0
-    for i in range(len(path) - 1):
-        current_node = path[i]
-        next_node = path[i + 1]
-        neighbors = graph.getNeighbours(current_node)
-        edge_weight = None
-        for neighbor, weight in neighbors:
-            if neighbor == next_node:
-                edge_weight = weight
-                break
-        if edge_weight is None:
-            raise ValueError(f"No edge between {current_node} and {next_node}")
-        distance += edge_weight
-    return distance
-
-def get_initial_path(graph):
+    return graph.pathCost(path)
+
+def get_initial_path(graph, method='random'):
+    if method != 'random':
+        return construct_path(graph, method)
     population = []
     cities = list(graph.map.keys())
     current = random.choice(cities)
@@ -92,7 +45,7 @@ def get_initial_path(graph):
         population.append((tsp_fitness(path, graph), all_visited, path))
     return sorted(population)[0]
 
-def get_successor(graph, prev_path):
+def get_successor(graph, prev_path, instrument=None):
     successors = []
     goal = prev_path[0]
     cities = list(graph.map.keys())
@@ -122,26 +75,100 @@ def get_successor(graph, prev_path):
             current = random_neighbor
             all_visited += 1
 
+        if instrument is not None:
+            instrument.evaluations += 1
+            instrument.enter('scoring')
         successors.append((tsp_fitness(path, graph), all_visited, path))
+        if instrument is not None:
+            instrument.leave()
     return sorted(successors)[0]
 
-def simulated_annealing(current_route, current_cost, start_temp, end_temp, cooling_rate, num_iterations, cities_graph):
+def simulated_annealing(current_route, current_cost, start_temp, end_temp, cooling_rate, num_iterations, cities_graph, neighbourhood='regrow', target_gap=None, instrument=None, stopping=None):
+    if neighbourhood not in ('regrow', 'moves', 'knn'):
+        raise ValueError(f"Simulated annealing has no {neighbourhood} neighbourhood, use regrow, moves or knn")
+    target = gap_target(cities_graph, target_gap, current_cost)
+    if neighbourhood in ('moves', 'knn'):
+        candidates = candidate_lists(cities_graph) if neighbourhood == 'knn' else None
+        return simulated_annealing_moves(current_route, start_temp, end_temp, cooling_rate, num_iterations, cities_graph, candidates=candidates, target=target,
+                                         instrument=instrument, stopping=stopping)
     best_route = current_route
     best_cost = current_cost
     temp = start_temp
+    reason = 'iterations'
     for i in range(num_iterations):
-        neighbor_cost, _, neighbor_route = get_successor(cities_graph, best_route)
+        if target is not None and best_cost <= target:
+            break
+        if instrument is not None:
+            instrument.enter('neighbours')
+        neighbor_cost, _, neighbor_route = get_successor(cities_graph, best_route, instrument)
+        if instrument is not None:
+            instrument.switch('selection')
+            instrument.proposed += 1
         if neighbor_cost < current_cost or random.random() < math.exp((current_cost - neighbor_cost) / temp):
             current_route = neighbor_route
             current_cost = neighbor_cost
+            if instrument is not None:
+                instrument.accepted += 1
         if current_cost < best_cost:
             best_route = current_route
             best_cost = current_cost
+        if instrument is not None:
+            instrument.leave()
+            instrument.iteration(i, current_cost, best_cost, temperature=temp)
+        if stopping is not None and stopping.check(best_cost, 10 * (i + 1)):
+            break
         temp *= cooling_rate
         if temp < end_temp:
+            reason = 'temperature'
             break
+    if stopping is not None:
+        stopping.finish('target' if target is not None and best_cost <= target else reason)
     return best_route, best_cost
 
+def simulated_annealing_moves(current_route, start_temp, end_temp, cooling_rate, num_iterations, cities_graph, rng=random, candidates=None, target=None, stats=None, instrument=None, stopping=None):
+    '''
+        Annealing over 2-opt/Or-opt/swap moves, trying one move per city at each temperature,
+        until the best cost reaches target or the stopping criteria, checked at every temperature, end it.
+        The evaluated and accepted moves are counted into stats when given, and every temperature step is recorded by instrument.
+    '''
+    if instrument is not None:
+        instrument.enter('init')
+    engine = MoveEngine(cities_graph.dist, route_to_ids(cities_graph, current_route), rng=rng, candidates=candidates, instrument=instrument)
+    if instrument is not None:
+        instrument.leave()
+    best_tour, best_cost = engine.tour.copy(), engine.cost
+    at_best = False
+    temp = start_temp
+    reason = 'iterations'
+    for i in range(num_iterations):
+        for _ in range(engine.n):
+            move, delta = engine.propose()
+            if delta < 0 or rng.random() < math.exp(-delta / temp):
+                if at_best and engine.cost + delta >= best_cost:
+                    #snapshot the best tour lazily, only once we are about to move away from it
+                    best_tour = engine.tour.copy()
+                    at_best = False
+                engine.apply(move, delta)
+                if engine.cost < best_cost - 1e-9:
+                    best_cost = engine.cost
+                    at_best = True
+        if instrument is not None:
+            instrument.iteration(i, engine.cost, best_cost, temperature=temp)
+        if stopping is not None and stopping.check(best_cost, engine.proposed):
+            break
+        temp *= cooling_rate
+        if temp < end_temp or (target is not None and best_cost <= target):
+            reason = 'temperature' if temp < end_temp else 'target'
+            break
+    if stopping is not None:
+        stopping.finish(reason)
+    if at_best:
+        best_tour = engine.tour.copy()
+    if stats is not None:
+        stats.update(evaluations=engine.proposed, moves=engine.applied)
+    best_route = cities_graph.toNames(best_tour)
+    return best_route + best_route[:1], best_cost
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Traveling Salesman Problem Solver')
     parser.add_argument('--file', help='Path to the cities file')
@@ -149,8 +176,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     if args.file:
-        cities_graph = Graph()
-        add_edges_from_file(cities_graph, args.file)
+        cities_graph = load_graph(args.file)
 
         current_cost, _, current_route = get_initial_path(cities_graph)
 
@@ -0,0 +1,151 @@
+import numpy as np
+from loader import RADIUS_OF_EARTH
+
+def project(lat, lon):
+    '''
+        Equirectangular projection of the coordinates to kilometers around their mean latitude.
+        Distances are close to the haversine ones for regional instances, which is all candidate lists need.
+    '''
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    x = RADIUS_OF_EARTH * lon * np.cos(lat.mean() if len(lat) else 0.0)
+    y = RADIUS_OF_EARTH * lat
+    return x, y
+
+class GridIndex:
+    '''
+        Uniform grid over planar points, sized so that a cell holds about points_per_cell points.
+        The cell size comes from the box between the 1st and 99th percentiles of the coordinates and the points inside it,
+        so a few far outliers can't stretch the cells until the whole instance shares one.
+        Nearest neighbour queries scan square rings of cells around the query cell and stop
+        once the k-th best distance is within the ring radius, so they are exact.
+        Distances are computed for at most chunk_size pairs at a time, whatever the number of points per cell.
+    '''
+    def __init__(self, x, y, points_per_cell=2, chunk_size=1 << 22):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.chunk_size = chunk_size
+        n = len(self.x)
+        self.x0, self.y0 = (self.x.min(), self.y.min()) if n else (0.0, 0.0)
+        if n:
+            (left, right), (bottom, top) = np.percentile(self.x, (1, 99)), np.percentile(self.y, (1, 99))
+            inside = max(int(np.count_nonzero((self.x >= left) & (self.x <= right) & (self.y >= bottom) & (self.y <= top))), 1)
+        else:
+            left = right = bottom = top = 0.0
+            inside = 1
+        width = max(right - left, 1e-9)
+        height = max(top - bottom, 1e-9)
+        #nearly collinear points would otherwise get a vanishing cell size
+        area = max(width * height, max(width, height) ** 2 / inside)
+        self.cell = np.sqrt(area * points_per_cell / inside)
+        self.cx = ((self.x - self.x0) / self.cell).astype(np.int64)
+        self.cy = ((self.y - self.y0) / self.cell).astype(np.int64)
+
+        #group point ids by cell: sort once, then slice every cell out of the sorted order
+        order = np.lexsort((self.cy, self.cx))
+        keys = np.stack((self.cx[order], self.cy[order]), axis=1)
+        starts = np.flatnonzero(np.r_[True, (np.diff(keys, axis=0) != 0).any(axis=1)]) if n else np.array([], dtype=np.int64)
+        ends = np.r_[starts[1:], n]
+        self.cells = {(int(keys[s, 0]), int(keys[s, 1])): order[s:e] for s, e in zip(starts, ends)}
+
+    def __block(self, cx, cy, radius):
+        found = [self.cells.get((cx + dx, cy + dy)) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)]
+        found = [ids for ids in found if ids is not None]
+        return np.concatenate(found) if found else np.array([], dtype=np.intp)
+
+    def knn(self, k):
+        '''Returns an (n, k) array holding the ids of each point's k nearest other points, closest first'''
+        n = len(self.x)
+        k = min(k, n - 1)
+        result = np.empty((n, max(k, 0)), dtype=np.intp)
+        if k <= 0:
+            return result
+        everything = np.arange(n)
+        for (cx, cy), members in self.cells.items():
+            pending = members
+            radius = 1
+            while len(pending):
+                #once a ring would cover more cells than are occupied, every point is a candidate and the answer is exact
+                exhaustive = (2 * radius + 1) ** 2 >= len(self.cells)
+                candidates = everything if exhaustive else self.__block(cx, cy, radius)
+                if len(candidates) <= k and not exhaustive:
+                    #an isolated cell widens its search quickly
+                    radius *= 2
+                    continue
+                rows = max(1, self.chunk_size // len(candidates))
+                left = []
+                for start in range(0, len(pending), rows):
+                    chunk = pending[start:start + rows]
+                    nearest, kth = self.__nearest(chunk, candidates, k)
+                    #anything outside the scanned block is at least radius cells away
+                    done = np.ones(len(chunk), dtype=bool) if exhaustive else kth <= radius * self.cell
+                    result[chunk[done]] = nearest[done]
+                    left.append(chunk[~done])
+                pending = np.concatenate(left)
+                radius += 1
+        return result
+
+    def nearest(self, x, y, alive):
+        '''
+            Id of the point closest to (x, y) among those whose alive flag is set, or -1 when none is.
+            Scans widening rings of cells around (x, y) as knn does, and every point once a ring would cover all the cells.
+        '''
+        cx, cy = int((x - self.x0) // self.cell), int((y - self.y0) // self.cell)
+        radius = 1
+        while True:
+            exhaustive = (2 * radius + 1) ** 2 >= len(self.cells)
+            candidates = np.arange(len(self.x)) if exhaustive else self.__block(cx, cy, radius)
+            candidates = candidates[alive[candidates]]
+            if len(candidates):
+                d = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+                best = int(np.argmin(d))
+                #anything outside the scanned block is at least radius cells away
+                if exhaustive or d[best] <= radius * self.cell:
+                    return int(candidates[best])
+            elif exhaustive:
+                return -1
+            radius *= 2
+
+    def __nearest(self, chunk, candidates, k):
+        '''Ids of the k candidates closest to each point of chunk, closest first, and the distance of the k-th'''
+        d = np.hypot(self.x[chunk, None] - self.x[candidates], self.y[chunk, None] - self.y[candidates])
+        d[chunk[:, None] == candidates[None, :]] = np.inf
+        nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+        nearest_d = np.take_along_axis(d, nearest, axis=1)
+        ranked = np.argsort(nearest_d, axis=1)
+        nearest = np.take_along_axis(nearest, ranked, axis=1)
+        kth = np.take_along_axis(nearest_d, ranked[:, -1:], axis=1)[:, 0]
+        return candidates[nearest], kth
+
+def planar_coordinates(graph):
+    '''(x, y) arrays of the graph's nodes on a plane, projecting latitude/longitude if needed, or None if it has no coordinates'''
+    planar = getattr(graph, 'planar', None)
+    if planar is not None:
+        return planar[:, 0], planar[:, 1]
+    coordinates = getattr(graph, 'coordinates', None)
+    if coordinates is not None:
+        return project(coordinates[:, 0], coordinates[:, 1])
+    return None
+
+def candidate_lists(graph, k=8, ids=None):
+    '''
+        k nearest neighbours of every city of a MatrixGraph, or with ids, of the cities ids among themselves
+        (row r then holds the nearest of ids to ids[r], as graph ids).
+        Uses a grid over the planar or projected coordinates when the graph knows them,
+        otherwise a partial sort of each row of the distance matrix.
+    '''
+    n = graph.numOfNodes() if ids is None else len(ids)
+    k = min(k, n - 1)
+    xy = planar_coordinates(graph)
+    if xy is not None:
+        if ids is None:
+            return GridIndex(*xy).knn(k)
+        return ids[GridIndex(xy[0][ids], xy[1][ids]).knn(k)]
+    dist = np.array(graph.dist if ids is None else graph.dist[np.ix_(ids, ids)], dtype=np.float64)
+    if k <= 0:
+        return np.empty((n, 0), dtype=np.intp)
+    np.fill_diagonal(dist, np.inf)
+    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    ranked = np.argsort(np.take_along_axis(dist, nearest, axis=1), axis=1)
+    nearest = np.take_along_axis(nearest, ranked, axis=1)
+    return nearest if ids is None else ids[nearest]
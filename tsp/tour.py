@@ -0,0 +1,301 @@
+import math
+from collections import deque
+import numpy as np
+from moves import route_to_ids
+from spatial import candidate_lists
+
+EPSILON = 1e-9
+
+class ArrayTour:
+    '''
+        Closed tour as an array of city ids with the inverse position array, so a city's position,
+        successor and predecessor are O(1). Reversing a path rewrites the shorter of its two sides, O(n) at worst.
+    '''
+    def __init__(self, tour):
+        self.tour = np.array(tour, dtype=np.intp)
+        self.n = len(self.tour)
+        self.pos = np.empty(self.n, dtype=np.intp)
+        self.pos[self.tour] = np.arange(self.n)
+
+    def next(self, city):
+        return int(self.tour[(self.pos[city] + 1) % self.n])
+
+    def prev(self, city):
+        return int(self.tour[self.pos[city] - 1])
+
+    def between(self, a, b, c):
+        '''True when b lies on the path going forward from a to c, ends included'''
+        i, j, k = self.pos[a], self.pos[b], self.pos[c]
+        if i <= k:
+            return i <= j <= k
+        return j >= i or j <= k
+
+    def reverse(self, a, b):
+        '''
+            Reverses the path going forward from a to b. When the rest of the tour is shorter it is reversed instead,
+            which gives the same cycle traversed in the other direction.
+        '''
+        n = self.n
+        i, j = int(self.pos[a]), int(self.pos[b])
+        length = (j - i) % n + 1
+        if 2 * length > n:
+            i, length = (j + 1) % n, n - length
+        idx = np.arange(i, i + length) % n
+        self.tour[idx] = self.tour[idx[::-1]]
+        self.pos[self.tour[idx]] = idx
+
+    def sequence(self):
+        return self.tour.copy()
+
+class TwoLevelTour:
+    '''
+        Closed tour as a two-level doubly linked list: the cities are cut into segments of about sqrt(n) cities,
+        each a list with a reversed bit, and the segments form a ring ordered by rank.
+        A city's place in its segment is a sequence number relative to the segment's start, so cities can be
+        added at either end of a segment without renumbering the others.
+        next, prev and between are O(1). Reversing a path first moves a few cities between neighbouring segments
+        so the path starts and ends on segment boundaries, then reverses the order of the whole segments in between
+        (or on the other side, whichever are fewer) and flips their reversed bits: O(sqrt(n)) instead of copying the tour.
+        Segments are rebuilt to even sizes should one grow past four times the intended size.
+    '''
+    def __init__(self, tour, group_size=None):
+        self.n = len(tour)
+        #at least two segments, so a path can always be cut loose from the rest of the tour
+        self.group_size = max(1, min(group_size or max(8, math.isqrt(self.n)), (self.n + 1) // 2))
+        self.__build(tour)
+
+    def __build(self, tour):
+        size = self.group_size
+        tour = np.asarray(tour, dtype=np.intp)
+        positions = np.arange(self.n)
+        seg = np.empty(self.n, dtype=np.intp)
+        idx = np.empty(self.n, dtype=np.intp)
+        seg[tour] = positions // size
+        idx[tour] = positions % size
+        self.seg, self.idx = seg.tolist(), idx.tolist()
+        tour = tour.tolist()
+        self.members = [tour[k:k + size] for k in range(0, self.n, size)]
+        self.start = [0] * len(self.members)
+        self.rev = [False] * len(self.members)
+        self.order = list(range(len(self.members)))
+        self.rank = list(range(len(self.members)))
+        self.unbalanced = False
+
+    def __first(self, s):
+        return self.members[s][-1] if self.rev[s] else self.members[s][0]
+
+    def __last(self, s):
+        return self.members[s][0] if self.rev[s] else self.members[s][-1]
+
+    def next(self, city):
+        s = self.seg[city]
+        i = self.idx[city] - self.start[s]
+        members = self.members[s]
+        if self.rev[s]:
+            if i > 0:
+                return members[i - 1]
+        elif i + 1 < len(members):
+            return members[i + 1]
+        return self.__first(self.order[(self.rank[s] + 1) % len(self.order)])
+
+    def prev(self, city):
+        s = self.seg[city]
+        i = self.idx[city] - self.start[s]
+        members = self.members[s]
+        if self.rev[s]:
+            if i + 1 < len(members):
+                return members[i + 1]
+        elif i > 0:
+            return members[i - 1]
+        return self.__last(self.order[self.rank[s] - 1])
+
+    def __offset(self, city):
+        '''Position of city along its segment in tour order'''
+        s = self.seg[city]
+        i = self.idx[city] - self.start[s]
+        return len(self.members[s]) - 1 - i if self.rev[s] else i
+
+    def between(self, a, b, c):
+        '''True when b lies on the path going forward from a to c, ends included'''
+        i, j, k = [(self.rank[self.seg[city]], self.__offset(city)) for city in (a, b, c)]
+        if i <= k:
+            return i <= j <= k
+        return j >= i or j <= k
+
+    def __take(self, s, k, head):
+        '''Removes the first k cities of segment s in tour order (head), or all but them, and returns them in tour order'''
+        members = self.members[s]
+        count = k if head else len(members) - k
+        if head != self.rev[s]:
+            taken = members[:count]
+            del members[:count]
+            self.start[s] += count
+        else:
+            taken = members[len(members) - count:]
+            del members[len(members) - count:]
+        return taken[::-1] if self.rev[s] else taken
+
+    def __put(self, t, cities, head):
+        '''Adds cities, given in tour order, at the start (head) or the end of segment t'''
+        members = self.members[t]
+        if self.rev[t]:
+            cities = cities[::-1]
+        if head != self.rev[t]:
+            self.start[t] -= len(cities)
+            members[0:0] = cities
+            base = self.start[t]
+        else:
+            base = self.start[t] + len(members)
+            members.extend(cities)
+        seg, idx = self.seg, self.idx
+        for i, city in enumerate(cities):
+            seg[city] = t
+            idx[city] = base + i
+        if len(members) > 4 * self.group_size:
+            self.unbalanced = True
+
+    def __split(self, city, fixed=None):
+        '''
+            Makes city the first of its segment, by moving the cities before it to the end of the previous segment
+            or it and the cities after it to the start of the next one, whichever are fewer.
+            Neither may disturb fixed, a city that already starts a segment.
+        '''
+        s = self.seg[city]
+        k = self.__offset(city)
+        if k == 0:
+            return
+        r = self.rank[s]
+        previous, following = self.order[r - 1], self.order[(r + 1) % len(self.order)]
+        fixed_segment = self.seg[fixed] if fixed is not None else None
+        to_previous = 2 * k <= len(self.members[s])
+        if s == fixed_segment:
+            to_previous = False
+        elif following == fixed_segment:
+            to_previous = True
+        if to_previous:
+            self.__put(previous, self.__take(s, k, True), False)
+        else:
+            self.__put(following, self.__take(s, k, False), True)
+
+    def reverse(self, a, b):
+        '''Reverses the path going forward from a to b, or the rest of the tour, as ArrayTour.reverse does'''
+        if a == b:
+            return
+        s = self.seg[a]
+        if s == self.seg[b] and self.__offset(a) <= self.__offset(b):
+            start = self.start[s]
+            i, j = sorted((self.idx[a] - start, self.idx[b] - start))
+            members = self.members[s]
+            members[i:j + 1] = members[i:j + 1][::-1]
+            for k in range(i, j + 1):
+                self.idx[members[k]] = start + k
+            return
+        after = self.next(b)
+        if after == a:
+            #the path is the whole tour, which as a cycle is unchanged by the reversal
+            return
+        self.__split(a)
+        self.__split(after, a)
+        order, count = self.order, len(self.order)
+        first = self.rank[self.seg[a]]
+        length = (self.rank[self.seg[b]] - first) % count + 1
+        if 2 * length > count:
+            first, length = (first + length) % count, count - length
+        positions = [(first + q) % count for q in range(length)]
+        segments = [order[p] for p in reversed(positions)]
+        for p, t in zip(positions, segments):
+            order[p] = t
+            self.rank[t] = p
+            self.rev[t] = not self.rev[t]
+        if self.unbalanced:
+            self.__build(self.sequence())
+
+    def sequence(self):
+        '''Cities in tour order, starting with the first segment of the ring'''
+        return np.concatenate([self.members[s][::-1] if self.rev[s] else self.members[s] for s in self.order]).astype(np.intp)
+
+def two_opt_search(graph, route, candidates=None, two_level=True, max_moves=None, target=None, stats=None, instrument=None, stopping=None):
+    '''
+        Neighbour list 2-opt with don't-look bits that only goes through next, prev and reverse of a TwoLevelTour
+        (or an ArrayTour when two_level is False), so applying a move never copies the tour.
+        For each queued city a, both of its tour edges (a, b) are tried against the edges (c, d) of its candidates c,
+        and the cities of an applied move are queued again. Stops at a local optimum, after max_moves moves
+        or once the cost reaches target. Returns the closed route as names and its cost;
+        the evaluated and applied moves are counted into stats when given.
+        With an instrument, scanning a city's candidates is timed as scoring, applying a move as selection,
+        and a record is added every n cities taken off the queue; the stopping criteria are checked as often.
+    '''
+    if instrument is not None:
+        instrument.enter('init')
+    if candidates is None:
+        candidates = candidate_lists(graph)
+    candidates = candidates.tolist()
+    dist = graph.dist
+    ids = route_to_ids(graph, route)
+    tour = TwoLevelTour(ids) if two_level else ArrayTour(ids)
+    cost = graph.idTourCost(ids)
+    queue = deque(ids.tolist())
+    active = set(queue)
+    moves = evaluations = popped = 0
+    if instrument is not None:
+        instrument.leave()
+    while queue and (max_moves is None or moves < max_moves) and (target is None or cost > target):
+        if instrument is not None:
+            instrument.enter('scoring')
+        a = queue.popleft()
+        active.discard(a)
+        for forward in (True, False):
+            b = tour.next(a) if forward else tour.prev(a)
+            d_ab = dist[a, b]
+            move = None
+            for c in candidates[a]:
+                d_ac = dist[a, c]
+                if d_ab - d_ac <= EPSILON:
+                    break
+                d = tour.next(c) if forward else tour.prev(c)
+                if c == b or d == a:
+                    continue
+                delta = d_ac + dist[b, d] - d_ab - dist[c, d]
+                evaluations += 1
+                if instrument is not None:
+                    instrument.evaluations += 1
+                    instrument.proposed += 1
+                if delta < -EPSILON:
+                    move = (c, d, delta)
+                    break
+            if move is None:
+                continue
+            c, d, delta = move
+            if instrument is not None:
+                instrument.switch('selection')
+                instrument.accepted += 1
+            #a b ... c d becomes a c ... b d, and b a ... d c becomes b d ... a c
+            if forward:
+                tour.reverse(b, c)
+            else:
+                tour.reverse(a, d)
+            cost += float(delta)
+            moves += 1
+            for city in (a, b, c, d):
+                if city not in active:
+                    active.add(city)
+                    queue.append(city)
+            break
+        if instrument is not None:
+            instrument.leave()
+        if instrument is not None or stopping is not None:
+            popped += 1
+            if popped % tour.n == 0:
+                if instrument is not None:
+                    instrument.iteration(popped // tour.n, cost, cost, queued=len(queue))
+                if stopping is not None and stopping.check(cost, evaluations):
+                    break
+    if stopping is not None:
+        if target is not None and cost <= target:
+            stopping.finish('target')
+        else:
+            stopping.finish('converged' if not queue else 'iterations')
+    if stats is not None:
+        stats.update(evaluations=evaluations, moves=moves)
+    names = graph.toNames(tour.sequence())
+    return names + names[:1], cost
@@ -1,30 +1,102 @@
 import argparse
+import os
 import random
-from genetic import add_edges_from_file as genetic_add_edges_from_file, genetic_algorithm, tsp_fitness as genetic_fitness
-from graph import Graph as CitiesGraph
+import sys
+import numpy as np
+#the common package shared with the other solver lives at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from genetic import genetic_algorithm, genetic_algorithm_array, memetic_algorithm, tsp_fitness as genetic_fitness
+from loader import load_graph, load_lazy_graph
+from lk import lk_search
+from exact import exact_tour
+from multistart import multi_start
+from island import island_genetic_algorithm
 from hill import get_initial_path as hill_get_initial_path, hill_climbing, main as hill_main
 from simulated import simulated_annealing, get_initial_path as simulated_get_initial_path
+from common.instrument import Instrument
+from common.stopping import StoppingCriteria
+
+def open_graph(args, dtype):
+    if args.lazy_cache:
+        return load_lazy_graph(args.cities, cache_size=args.lazy_cache, dtype=dtype, column_cache=args.column_cache)
+    return load_graph(args.cities, dtype=dtype, cache_dir=args.cache_dir, column_cache=args.column_cache)
+
+def print_start_stats(stats):
+    for stat in stats:
+        stopped = f", stopped by {stat['stopped']}" if stat['stopped'] else ""
+        print(f"Start {stat['start']} (seed {stat['seed']}, pid {stat['pid']}): cost {stat['initial_cost']:.2f} -> {stat['cost']:.2f} in {stat['seconds']:.2f} seconds{stopped}")
+
+def print_instrument_summary(instrument):
+    summary = instrument.summary()
+    print(f"{summary['iterations']} iterations, {summary['evaluations']} evaluations, {summary['proposed']} moves proposed, {summary['accepted']} accepted in {summary['seconds']:.2f} seconds")
+    print("Phase seconds: " + ", ".join(f"{phase} {seconds:.3f}" for phase, seconds in summary['phases'].items()))
 
 def main():
     parser = argparse.ArgumentParser(description='Traveling Salesman Problem Solver')
-    parser.add_argument('--algorithm', choices=['sa', 'ha', 'ga'], help='Algorithm to use (sa for simulated annealing, ha for hill climbing, ga for genetic algorithm)')
-    parser.add_argument('--cities', help='Path to the cities file')  # Change '--file' to '--cities'
+    parser.add_argument('--algorithm', choices=['sa', 'ha', 'ga', 'lk', 'exact'], help='Algorithm to use (sa for simulated annealing, ha for hill climbing, ga for genetic algorithm, lk for Or-opt/LK-style local optimisation, exact for Held-Karp dynamic programming on small instances)')
+    parser.add_argument('--cities', help='Path to the cities file, or a TSPLIB .tsp file')  # Change '--file' to '--cities'
+    parser.add_argument('--neighbourhood', choices=['regrow', 'moves', 'knn', 'steepest', 'twolevel'], default='regrow', help='Successor generation for sa/ha: regrow random walks, delta-evaluated 2-opt/Or-opt/swap moves, those moves restricted to nearest-neighbour candidates, or (ha only) vectorised best-improvement 2-opt or neighbour-list 2-opt on a two-level list tour')
+    parser.add_argument('--init', choices=['random', 'nearest', 'greedy', 'christofides', 'hilbert'], default='random', help='Initial route for sa/ha/lk: best of 20 random walks, or a nearest neighbour, greedy edge, Christofides-lite or Hilbert curve construction')
+    parser.add_argument('--polish', action='store_true', help='Improve the route found by sa/ha/ga with the lk local optimiser')
+    parser.add_argument('--starts', type=int, default=1, help='Number of independent sa/ha restarts to run in parallel')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for --starts (defaults to the number of CPUs)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed the restarts draw their RNG streams from')
+    parser.add_argument('--crossover', choices=['prefix', 'ox', 'pmx'], default='prefix', help='ga crossover: prefix copy on lists of names, or OX/PMX on an array-backed population')
+    parser.add_argument('--memetic', action='store_true', help='ga with tournament selection, edge recombination and 2-opt repair of every child')
+    parser.add_argument('--population-size', type=int, default=20, help='ga population size (per island)')
+    parser.add_argument('--generations', type=int, default=1000, help='Number of ga generations')
+    parser.add_argument('--islands', type=int, default=1, help='Number of ga sub-populations evolved in parallel processes')
+    parser.add_argument('--migration-interval', type=int, default=50, help='Generations between migrations of the best individuals across islands')
+    parser.add_argument('--topology', choices=['ring', 'full'], default='ring', help='Which islands exchange migrants')
+    parser.add_argument('--target-gap', type=float, default=None, help='Stop sa/ha/ga once the best tour is within this fraction (0.01 for 1%%) of the Held-Karp lower bound')
+    parser.add_argument('--lazy-cache', type=int, default=None, help='Compute distances on demand, keeping at most this many pairs in an LRU cache, instead of building the n x n matrix')
+    parser.add_argument('--cache-dir', default=None, help='Directory of the memory-mapped float32 distance matrix cache (defaults to $TSP_DISTANCE_CACHE)')
+    parser.add_argument('--column-cache', action='store_true', help='Keep a binary columnar copy of the parsed cities file next to it for faster reloads')
+    parser.add_argument('--float32', action='store_true', help='Store distances in single precision to halve the memory of the distance matrix')
+    parser.add_argument('--deadline', type=float, default=None, help='Wall-clock seconds, counted from start-up, after which an sa/ha/ga/lk run (each restart of --starts or island of --islands) returns its best tour')
+    parser.add_argument('--max-evaluations', type=int, default=None, help='Stop an sa/ha/ga/lk run (each restart of --starts or island of --islands) after this many scored tours or moves')
+    parser.add_argument('--patience', type=int, default=None, help='Stop an sa/ha/ga/lk run (each restart of --starts or island of --islands) after this many iterations (epochs, temperatures, generations or lk passes of n queued cities) without a better tour')
+    parser.add_argument('--target-cost', type=float, default=None, help='Stop an sa/ha/ga/lk run (each restart of --starts or island of --islands) once its best tour costs at most this much')
+    parser.add_argument('--trace', default=None, help='Write the convergence trace of a single sa/ha/ga/lk run to this file (JSON for a .json name, CSV otherwise) and print its counters and phase times')
 
     args = parser.parse_args()
+    if args.starts > 1 and args.trace:
+        parser.error('--trace records a single run, it can\'t be combined with --starts')
+    if args.islands > 1 and args.trace:
+        parser.error('--trace records a single run, it can\'t be combined with --islands')
+    if args.lazy_cache and (args.starts > 1 or args.islands > 1):
+        parser.error('--starts and --islands share a dense distance matrix between processes, they can\'t be combined with --lazy-cache')
+    if args.migration_interval < 1:
+        parser.error('--migration-interval must be at least 1')
+    if args.algorithm == 'sa' and args.neighbourhood in ('steepest', 'twolevel'):
+        parser.error(f'--neighbourhood {args.neighbourhood} is a descent for ha, sa takes regrow, moves or knn')
+    if args.islands > 1 and (args.memetic or args.crossover != 'prefix'):
+        parser.error('--islands evolves prefix crossover populations, it can\'t be combined with --memetic or --crossover ox/pmx')
+    dtype = np.float32 if args.float32 else np.float64
+    instrument = Instrument() if args.trace else None
+    stopping = None
+    if any(value is not None for value in (args.deadline, args.max_evaluations, args.patience, args.target_cost)):
+        stopping = StoppingCriteria(deadline=args.deadline, max_evaluations=args.max_evaluations, patience=args.patience, target=args.target_cost)
 
     if args.algorithm == 'sa':
         if args.cities:  # Change 'args.file' to 'args.cities'
-            cities_graph = CitiesGraph()
-            genetic_add_edges_from_file(cities_graph, args.cities)  # Change 'args.file' to 'args.cities'
+            cities_graph = open_graph(args, dtype)
 
-            current_cost, _, current_route = simulated_get_initial_path(cities_graph)
+            current_cost, _, current_route = simulated_get_initial_path(cities_graph, args.init)
 
             start_temp = 100
             end_temp = 0.1
             cooling_rate = 0.99
             num_iterations = 10000
 
-            best_route, best_cost = simulated_annealing(current_route, current_cost, start_temp, end_temp, cooling_rate, num_iterations, cities_graph)
+            if args.starts > 1:
+                best_route, best_cost, stats = multi_start(cities_graph, args.starts, 'sa', args.neighbourhood, args.workers, args.seed, init=args.init, target_gap=args.target_gap,
+                                                           stopping=stopping, start_temp=start_temp, end_temp=end_temp, cooling_rate=cooling_rate, num_iterations=num_iterations)
+                print_start_stats(stats)
+            else:
+                best_route, best_cost = simulated_annealing(current_route, current_cost, start_temp, end_temp, cooling_rate, num_iterations, cities_graph, neighbourhood=args.neighbourhood, target_gap=args.target_gap, instrument=instrument, stopping=stopping)
+            if args.polish:
+                best_route, best_cost = lk_search(cities_graph, best_route)
 
             print("Best route found using simulated annealing: ", best_route)
             print("Cost of best route: ", best_cost)
@@ -32,35 +104,89 @@ def main():
             print("Please specify the path to the cities file.")
     elif args.algorithm == 'ha':
         if args.cities:  # Change 'args.file' to 'args.cities'
-            cities_graph = CitiesGraph()
-            genetic_add_edges_from_file(cities_graph, args.cities)  # Change 'args.file' to 'args.cities'
+            cities_graph = open_graph(args, dtype)
             cities = list(cities_graph.map.keys())
             num_iterations = 500
-            current_cost, _, current_route = hill_get_initial_path(cities_graph, cities)
-            best_route, best_cost = hill_climbing(current_route, current_cost, num_iterations, cities_graph, cities)
+            if args.starts > 1:
+                best_route, best_cost, stats = multi_start(cities_graph, args.starts, 'ha', args.neighbourhood, args.workers, args.seed, init=args.init, target_gap=args.target_gap,
+                                                           stopping=stopping, num_iterations=num_iterations)
+                print_start_stats(stats)
+            else:
+                current_cost, _, current_route = hill_get_initial_path(cities_graph, cities, args.init)
+                best_route, best_cost = hill_climbing(current_route, current_cost, num_iterations, cities_graph, cities, neighbourhood=args.neighbourhood, target_gap=args.target_gap, instrument=instrument, stopping=stopping)
+            if args.polish:
+                best_route, best_cost = lk_search(cities_graph, best_route)
             print("Best route found using hill climbing: ", best_route)
             print("Cost of best route: ", best_cost)
         else:
             print("Please specify the path to the cities file.")
     elif args.algorithm == 'ga':
         if args.cities:
-            cities_graph = CitiesGraph()
-            genetic_add_edges_from_file(cities_graph, args.cities)
+            cities_graph = open_graph(args, dtype)
             cities = list(cities_graph.map.keys())  # Get the list of cities
-            population_size = 20
-            generations = 1000
+            population_size = args.population_size
+            generations = args.generations
             best_path = None
             best_cost = float('inf')
-            population = genetic_algorithm(cities_graph, cities, population_size=population_size, generations=generations)  # Pass 'cities' as an argument
-            for path in population:
-                cost = genetic_fitness(path, cities_graph)
-                if cost < best_cost:
-                    best_cost = cost
-                    best_path = path
+            if args.memetic:
+                best_path, best_cost, _ = memetic_algorithm(cities_graph, population_size=population_size, generations=generations, seed=args.seed, target_gap=args.target_gap, instrument=instrument, stopping=stopping)
+            elif args.crossover != 'prefix':
+                best_path, best_cost, _ = genetic_algorithm_array(cities_graph, population_size=population_size, generations=generations, crossover=args.crossover, seed=args.seed, target_gap=args.target_gap, instrument=instrument, stopping=stopping)
+            elif args.islands > 1:
+                best_path, best_cost, stats = island_genetic_algorithm(cities_graph, num_islands=args.islands, population_size=population_size, generations=generations,
+                                                                       migration_interval=args.migration_interval, topology=args.topology, seed=args.seed,
+                                                                       target_gap=args.target_gap, stopping=stopping)
+                for stat in stats:
+                    print(f"Island {stat['island']} (seed {stat['seed']}): best {stat['cost']:.2f}, mean {stat['mean_cost']:.2f}, {stat['migrants_received']} migrants received in {stat['seconds']:.2f} seconds, stopped by {stat['stopped']}")
+            else:
+                population = genetic_algorithm(cities_graph, cities, population_size=population_size, generations=generations, target_gap=args.target_gap, instrument=instrument, stopping=stopping)  # Pass 'cities' as an argument
+                for path in population:
+                    cost = genetic_fitness(path, cities_graph)
+                    if cost < best_cost:
+                        best_cost = cost
+                        best_path = path
+            if args.polish:
+                best_path, best_cost = lk_search(cities_graph, best_path)
             print("Best route found using genetic algorithm:", best_path)
             print("Cost of best route:", best_cost)
         else:
             print("Please specify the path to the cities file.")
+    elif args.algorithm == 'lk':
+        if args.cities:
+            cities_graph = open_graph(args, dtype)
+            _, _, current_route = simulated_get_initial_path(cities_graph, args.init)
+            best_route, best_cost = lk_search(cities_graph, current_route, instrument=instrument, stopping=stopping)
+            print("Best route found using LK-style local optimisation: ", best_route)
+            print("Cost of best route: ", best_cost)
+        else:
+            print("Please specify the path to the cities file.")
+    elif args.algorithm == 'exact':
+        if args.cities:
+            cities_graph = open_graph(args, dtype)
+            best_route, best_cost = exact_tour(cities_graph)
+            print("Optimal route found using Held-Karp: ", best_route)
+            print("Cost of best route: ", best_cost)
+        else:
+            print("Please specify the path to the cities file.")
+
+    if stopping is not None and args.starts > 1 and args.algorithm in ('sa', 'ha'):
+        print(f"Stopping criteria checked by every start, {stopping.elapsed():.2f} seconds in all")
+    elif stopping is not None and args.islands > 1 and args.algorithm == 'ga':
+        print(f"Stopping criteria checked by every island, {stopping.elapsed():.2f} seconds in all")
+    elif stopping is not None:
+        print(f"Stopped by {stopping.reason or 'nothing: the stopping criteria apply to single sa, ha, ga and lk runs'} after {stopping.elapsed():.2f} seconds")
+
+    if instrument is not None:
+        if instrument.trace:
+            instrument.save(args.trace)
+            print(f"Trace written to {args.trace}")
+            print_instrument_summary(instrument)
+        else:
+            print("Nothing was traced: --trace applies to single sa, ha, ga and lk runs")
+
+    if args.lazy_cache and args.cities:
+        stats = cities_graph.dist.stats()
+        print(f"Distance cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
 
 
 if __name__ == "__main__":
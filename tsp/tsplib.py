@@ -0,0 +1,127 @@
+import math
+import numpy as np
+
+GEO_RADIUS = 6378.388
+EXPLICIT_FORMATS = ('FULL_MATRIX', 'UPPER_ROW', 'LOWER_ROW', 'UPPER_DIAG_ROW', 'LOWER_DIAG_ROW')
+
+def _read_numbers(file, count):
+    '''Reads whitespace separated numbers, possibly spread over many lines, until count of them are found'''
+    chunks = []
+    found = 0
+    while found < count:
+        line = file.readline()
+        if not line:
+            raise ValueError(f"Expected {count} numbers but the file ended after {found}")
+        values = np.array(line.split(), dtype=np.float64)
+        chunks.append(values)
+        found += len(values)
+    return np.concatenate(chunks)[:count] if chunks else np.empty(0)
+
+def read_tsplib(filename):
+    '''
+        Parses a TSPLIB .tsp file with a NODE_COORD_SECTION (EUC_2D, CEIL_2D, ATT, GEO) or an EXPLICIT EDGE_WEIGHT_SECTION.
+        Sections are read line by line straight into NumPy arrays, without a Python object per node.
+        Returns a dict with the header fields (upper case keys), 'coordinates' as an (n, 2) array or None
+        and 'weights' as the flat explicit weights or None.
+    '''
+    instance = {'coordinates': None, 'weights': None}
+    with open(filename, 'r') as file:
+        while True:
+            line = file.readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            if line == 'EOF':
+                break
+            if ':' in line:
+                key, value = line.split(':', 1)
+                instance[key.strip().upper()] = value.strip()
+                continue
+            section = line.upper()
+            dimension = int(instance['DIMENSION'])
+            if section == 'NODE_COORD_SECTION':
+                rows = _read_numbers(file, 3 * dimension).reshape(dimension, 3)
+                instance['coordinates'] = rows[np.argsort(rows[:, 0], kind='stable'), 1:]
+            elif section == 'EDGE_WEIGHT_SECTION':
+                instance['weights'] = _read_numbers(file, _explicit_count(instance.get('EDGE_WEIGHT_FORMAT', 'FULL_MATRIX'), dimension))
+            elif section == 'DISPLAY_DATA_SECTION':
+                _read_numbers(file, 3 * dimension)
+            else:
+                raise ValueError(f"Unsupported TSPLIB section: {section}")
+    if 'DIMENSION' not in instance:
+        raise ValueError(f"'{filename}' has no DIMENSION")
+    return instance
+
+def _explicit_count(edge_format, n):
+    if edge_format == 'FULL_MATRIX':
+        return n * n
+    if edge_format in ('UPPER_ROW', 'LOWER_ROW'):
+        return n * (n - 1) // 2
+    if edge_format in ('UPPER_DIAG_ROW', 'LOWER_DIAG_ROW'):
+        return n * (n + 1) // 2
+    raise ValueError(f"Unsupported EDGE_WEIGHT_FORMAT: {edge_format}")
+
+def explicit_matrix(weights, edge_format, n, dtype=np.float64):
+    '''Expands the flat weights of an EDGE_WEIGHT_SECTION into a symmetric n x n matrix'''
+    if edge_format not in EXPLICIT_FORMATS:
+        raise ValueError(f"Unsupported EDGE_WEIGHT_FORMAT: {edge_format}")
+    if edge_format == 'FULL_MATRIX':
+        return np.asarray(weights, dtype=dtype).reshape(n, n)
+    dist = np.zeros((n, n), dtype=dtype)
+    diagonal = 0 if 'DIAG' in edge_format else 1
+    #row-wise upper triangles are column-wise lower triangles, so one index set serves both
+    if edge_format.startswith('UPPER'):
+        rows, columns = np.triu_indices(n, diagonal)
+    else:
+        columns, rows = np.triu_indices(n, diagonal)
+        order = np.lexsort((columns, rows))
+        rows, columns = rows[order], columns[order]
+    dist[rows, columns] = weights
+    dist[columns, rows] = weights
+    return dist
+
+def geo_radians(values):
+    '''TSPLIB GEO coordinates are DDD.MM degrees and minutes'''
+    degrees = np.trunc(values)
+    return math.pi * (degrees + 5.0 * (values - degrees) / 3.0) / 180.0
+
+def coordinate_matrix(coordinates, edge_weight_type, dtype=np.float64, block_size=1024):
+    '''Pairwise TSPLIB distances of the nodes, computed in row blocks over the upper triangle'''
+    n = len(coordinates)
+    dist = np.empty((n, n), dtype=dtype)
+    x, y = coordinates[:, 0], coordinates[:, 1]
+    if edge_weight_type == 'GEO':
+        lat, lon = geo_radians(x), geo_radians(y)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        if edge_weight_type == 'GEO':
+            q1 = np.cos(lon[start:stop, None] - lon[None, start:])
+            q2 = np.cos(lat[start:stop, None] - lat[None, start:])
+            q3 = np.cos(lat[start:stop, None] + lat[None, start:])
+            block = np.floor(GEO_RADIUS * np.arccos(np.clip(0.5 * ((1 + q1) * q2 - (1 - q1) * q3), -1, 1)) + 1.0)
+        else:
+            dx = x[start:stop, None] - x[None, start:]
+            dy = y[start:stop, None] - y[None, start:]
+            if edge_weight_type == 'EUC_2D':
+                block = np.floor(np.sqrt(dx * dx + dy * dy) + 0.5)
+            elif edge_weight_type == 'CEIL_2D':
+                block = np.ceil(np.sqrt(dx * dx + dy * dy))
+            elif edge_weight_type == 'ATT':
+                r = np.sqrt((dx * dx + dy * dy) / 10.0)
+                t = np.floor(r + 0.5)
+                block = np.where(t < r, t + 1, t)
+            else:
+                raise ValueError(f"Unsupported EDGE_WEIGHT_TYPE: {edge_weight_type}")
+        dist[start:stop, start:] = block
+        dist[start:, start:stop] = block.T
+    np.fill_diagonal(dist, 0)
+    return dist
+
+def tsplib_distance_matrix(instance, dtype=np.float64):
+    n = int(instance['DIMENSION'])
+    edge_weight_type = instance.get('EDGE_WEIGHT_TYPE', 'EUC_2D')
+    if edge_weight_type == 'EXPLICIT':
+        return explicit_matrix(instance['weights'], instance.get('EDGE_WEIGHT_FORMAT', 'FULL_MATRIX'), n, dtype)
+    return coordinate_matrix(instance['coordinates'], edge_weight_type, dtype)